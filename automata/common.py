@@ -1,10 +1,15 @@
+import heapq
+import itertools
 import numpy
 from collections import deque, defaultdict
 from pygraphviz import AGraph
 from z3 import Solver, Int, sat
 from automata.rules import Rule
+from automata.frozen import FrozenTransducer
 from daikon.textpro import Message
+from daikon.corpus import Corpus
 from daikon.rulepro import build_rules, check_rules
+from daikon.minorpro import MinorTable, Minors, SpillMinors
 
 
 class State:
@@ -16,8 +21,12 @@ class State:
         self.logo = logo
         # 进入该状态的转移。
         self.before: set[Transition] = set()
-        # 离开该状态的转移。
+        # 离开该状态的转移，只能通过add_after、off_after修改，以便同步更新索引。
         self.after: set[Transition] = set()
+        # 离开转移的索引：(输入报文主要字段, 输出报文主要字段) -> 转移，前缀树以及合并后的状态机中至多有一个。
+        self.after_index: dict[tuple[str, str], Transition] = {}
+        # 离开转移的索引：输入报文主要字段 -> 转移集合。
+        self.give_index: dict[str, set[Transition]] = {}
         # 到达该状态的协议的数量。
         self.poll = poll
         # 在该状态结束的概率。
@@ -29,19 +38,52 @@ class State:
 
     __repr__ = __str__
 
+    def add_after(self, trani):
+        '''
+        添加离开转移，同时更新索引。
+        :type trani: Transition。
+        '''
+        self.after.add(trani)
+        self.after_index[(trani.give, trani.reap)] = trani
+        self.give_index.setdefault(trani.give, set()).add(trani)
+
+    def off_after(self, trani):
+        '''
+        删除离开转移，同时更新索引。
+        :type trani: Transition。
+        '''
+        self.after.discard(trani)
+        if self.after_index.get((trani.give, trani.reap)) is trani:
+            del self.after_index[(trani.give, trani.reap)]
+        gives = self.give_index.get(trani.give)
+        if gives is not None:
+            gives.discard(trani)
+            if not gives:
+                del self.give_index[trani.give]
+
+    def seek_after(self, give, reap):
+        '''
+        查找主要字段为(give, reap)的离开转移。
+        :rtype: Transition | None。
+        '''
+        return self.after_index.get((give, reap))
+
 
 class Transition:
     '''
     状态机的转移。
     '''
 
-    def __init__(self, mespair, begin = None, end = None, poll = 1):
+    def __init__(self, mespair, begin = None, end = None, poll = 1, table = None):
+        '''
+        :param table: 次要字段的编号表，一般是所属状态机的编号表，见Transducer.table。
+        '''
         # 输入报文的请求头、输出报文的响应码。
         self.give, self.reap = mespair.look_major()
         # 报文参数集合，可以存在重复元素，并不会影响Daikon系统的判断。
-        # 推断完毕规则之后应该释放，其占用的内存极大。
-        # :type: list[tuple[list[str]]]。
-        self.minors = [mespair.look_minors()]
+        # 推断完毕规则之后应该释放，其占用的内存极大，因此按列存储，合并时不复制，见daikon.minorpro。
+        # :type: Minors，迭代得到tuple[tuple[str], tuple[str]]。
+        self.minors = Minors([mespair.look_minors()], table)
         # 进入状态。
         self.begin: State = begin
         # 离开状态。
@@ -359,9 +401,13 @@ class Transducer:
     状态机。
     '''
 
-    def __init__(self, protocol):
+    def __init__(self, protocol, spill = False):
         # 状态机描述的协议。
         self.protocol: str = protocol
+        # 是否将转移的次要字段溢出到磁盘，见daikon.minorpro.SpillMinors。
+        self.spill = spill
+        # 本状态机的转移共用的次要字段编号表，随状态机以及转移一起释放，见daikon.minorpro.MinorTable。
+        self.table = MinorTable()
         # 起始状态。
         self.q0: State = State(0, 0)
         # 该状态机的所有状态。
@@ -374,6 +420,14 @@ class Transducer:
         self.gamma = set()
         # 当前状态节点计数。
         self.state_number = 1
+        # _compatible_test的结果缓存：(red, blue, level) -> 是否兼容。
+        self.compatibles: dict[tuple[State, State, int], bool] = {}
+        # 缓存的依赖：状态 -> 直接比较了该状态离开转移的键；键 -> 使用了该键结果的上一层的键。
+        self.compatible_states: dict[State, set[tuple]] = defaultdict(set)
+        self.compatible_parents: dict[tuple, set[tuple]] = defaultdict(set)
+        # 每次化简中，各level的缓存命中、未命中次数。
+        self.compatible_hits: dict[int, int] = defaultdict(int)
+        self.compatible_misses: dict[int, int] = defaultdict(int)
 
     def __str__(self):
         return f'Transducer of protocol: {self.protocol}'
@@ -396,6 +450,14 @@ class Transducer:
         #     elif not afteri.end:
         #         raise Exception('automata/common/print_transducer 离开状态为None!')
 
+    def tell_compatible(self):
+        '''
+        输出最近一次化简中_compatible_test各level的缓存命中、未命中次数。
+        '''
+        for leveli in sorted(set(self.compatible_hits) | set(self.compatible_misses), reverse = True):
+            hits, misses = self.compatible_hits[leveli], self.compatible_misses[leveli]
+            print(f'level {leveli}: hit {hits}, miss {misses}, rate {hits / (hits + misses):.3f}')
+
     def build_transition(self, fresh):
         '''
         在状态机中添加一个转移。
@@ -405,15 +467,15 @@ class Transducer:
         :rtype: State，是否创建了新的转移。
         '''
         # 状态机已经存在相同的转移 -> 查找进入状态的离开转移。
-        for trani in fresh.begin.after:
-            if (trani.give, trani.reap) == (fresh.give, fresh.reap):
-                trani.poll += 1
-                trani.end.poll += 1
-                # 将次要字段添加到列表中。
-                trani.minors.extend(fresh.minors)
-                return trani.end, False
+        trani = fresh.begin.seek_after(fresh.give, fresh.reap)
+        if trani:
+            # 将次要字段添加到列表中。
+            self._pass_transition(trani, fresh.poll, fresh.minors)
+            return trani.end, False
         # 状态机不存在相同的转移。
-        fresh.begin.after.add(fresh)
+        if self.spill and not isinstance(fresh.minors, SpillMinors):
+            fresh.minors = SpillMinors(fresh.minors)
+        fresh.begin.add_after(fresh)
         if fresh.end:
             fresh.end.before.add(fresh)
         else:
@@ -430,6 +492,16 @@ class Transducer:
             raise Exception('automata/common/build_transition 参数携带的报文存在None!')
         return fresh.end, True
 
+    @staticmethod
+    def _pass_transition(trani, poll, minors):
+        '''
+        报文经过已经存在的转移：增加计数，添加次要字段。
+        :type minors: Minors | list[tuple[tuple, tuple]]。
+        '''
+        trani.poll += poll
+        trani.end.poll += poll
+        trani.minors.extend(minors)
+
     def off_transition(self, old):
         '''
         TODO: 存在的意义？
@@ -437,58 +509,260 @@ class Transducer:
         :param old: 待删除的转移。
         :type old: Transition。
         '''
-        old.begin.after.discard(old)
+        old.begin.off_after(old)
         old.end.before.discard(old)
         self.transitions.discard(old)
         del old
 
-    def build_pretree(self, arrays):
+    def build_pretree(self, arrays, unique = False):
         '''
         根据报文序列构建前缀树状态机。
-        :param arrays: 报文序列。
+        :param arrays: 报文序列，也可以是Corpus，见build_corpus。
         :type arrays: list[list[Message]]。
+        :param unique: 是否先按照主要字段序列合并相同的流，见build_unique。
         '''
+        if isinstance(arrays, Corpus):
+            self.build_corpus(arrays)
+            return
+        if unique:
+            self.build_unique(arrays)
+            return
         # arrayi是包含Message的列表。
         for arrayi in arrays:
             now = self.q0
             now.poll += 1
             # arrayj是Message。
             for arrayj in arrayi:
-                fresh = Transition(arrayj, now)
-                now, temp = self.build_transition(fresh)
+                now = self.build_message(now, arrayj)
+
+    def build_message(self, now, mespair):
+        '''
+        在状态机中添加一个报文对。
+        折叠的报文对（poll > 1，见fold_message_seqs）在离开状态上形成自环，自环的计数为poll - 1，保持各状态的到达次数；
+        第一个报文对的次要字段加入进入转移，其余的加入自环。
+        :param now: 进入状态。
+        :type mespair: Message。
+        :return: 离开状态。
+        :rtype: State。
+        '''
+        # 已经存在的转移不需要创建新的Transition。
+        trani = now.seek_after(mespair.give_major, mespair.reap_major)
+        if trani:
+            self._pass_transition(trani, 1, (mespair.look_minors(),))
+            now = trani.end
+        else:
+            now, temp = self.build_transition(Transition(mespair, now, table = self.table))
+        if mespair.poll > 1:
+            # 自环的次要字段是折叠的其余报文对的次要字段。
+            loop = Transition(mespair, now, now, mespair.poll - 1, self.table)
+            loop.minors = Minors(mespair.folds, self.table)
+            end, temp = self.build_transition(loop)
+            # 新建的自环不会在build_transition中增加状态的计数。
+            if temp:
+                now.poll += mespair.poll - 1
+            now = end
+        return now
+
+    def build_unique(self, arrays):
+        '''
+        按照主要字段序列将流分组，每种序列只在前缀树中走一次，计数按照流的数量增加。
+        次要字段按照流原来的顺序加入转移，结果与逐个流构建的前缀树相同。
+        :type arrays: list[list[Message]]。
+        '''
+        # 主要字段序列 -> (第一个流, 流的下标, 各位置的次要字段, 各位置折叠的其余报文对的次要字段)，按照第一次出现的顺序排列。
+        groups: dict[tuple, tuple[list[Message], list[int], list[list], list[list | None]]] = {}
+        for i, arrayi in enumerate(arrays):
+            key = tuple([(arrayj.give_major, arrayj.reap_major, arrayj.poll) for arrayj in arrayi])
+            group = groups.get(key)
+            if not group:
+                group = groups[key] = (arrayi, [], [[] for _ in arrayi],
+                                       [[] if arrayj.poll > 1 else None for arrayj in arrayi])
+            group[1].append(i)
+            for minorsj, arrayj in zip(group[2], arrayi):
+                minorsj.append((arrayj.give_minors, arrayj.reap_minors))
+            for foldsj, arrayj in zip(group[3], arrayi):
+                if foldsj is not None:
+                    foldsj.append(arrayj.folds)
+        # 转移 -> 各组经过该转移的(流的下标, 次要字段, 是否是自环)；自环的次要字段是每个流的多行。
+        chunks: dict[Transition, list] = defaultdict(list)
+        for arrayi, indexes, minors, folds in groups.values():
+            poll = len(indexes)
+            now = self.q0
+            now.poll += poll
+            for arrayj, minorsj, foldsj in zip(arrayi, minors, folds):
+                # 折叠的报文对还要经过自环，见build_message。
+                for loop in (False, True) if arrayj.poll > 1 else (False,):
+                    count = poll * (arrayj.poll - 1) if loop else poll
+                    trani = now.seek_after(*arrayj.look_major())
+                    if trani:
+                        trani.poll += count
+                        trani.end.poll += count
+                    else:
+                        trani = Transition(arrayj, now, now if loop else None, count, self.table)
+                        trani.minors = Minors(table = self.table)
+                        self.build_transition(trani)
+                        if loop:
+                            now.poll += count
+                        else:
+                            trani.end.poll = count
+                    chunks[trani].append((indexes, foldsj if loop else minorsj, loop))
+                    now = trani.end
+        for trani, chunksi in chunks.items():
+            if len(chunksi) == 1:
+                indexes, minors, loop = chunksi[0]
+                trani.minors.extend(itertools.chain.from_iterable(minors) if loop else minors)
+                continue
+            # 多个组经过同一个转移时，按照流的下标归并。
+            merged = heapq.merge(*[zip(indexes, minors, itertools.repeat(loop)) for indexes, minors, loop in chunksi],
+                                 key = lambda pair: pair[0])
+            rows = []
+            for index, minori, loop in merged:
+                if loop:
+                    rows.extend(minori)
+                else:
+                    rows.append(minori)
+            trani.minors.extend(rows)
+
+    def build_corpus(self, corpus: Corpus):
+        '''
+        根据整数编号的语料构建前缀树状态机，结果与build_pretree相同。
+        已经走过的转移以(进入状态, 输入编号, 输出编号)为键记录，查找时不再逐个比较字符串。
+        :type corpus: Corpus。
+        '''
+        if corpus.polls.size and corpus.polls.max() > 1:
+            # 含有折叠的报文对时逐个报文对构建，见build_message。
+            for arrayi in corpus:
+                now = self.q0
+                now.poll += 1
+                for arrayj in arrayi:
+                    now = self.build_message(now, arrayj)
+            return
+        edges: dict[tuple[State, int, int], Transition] = {}
+        gives, reaps, offsets = corpus.gives.tolist(), corpus.reaps.tolist(), corpus.offsets.tolist()
+        minors = corpus.minor_pairs()
+        for i in range(len(corpus)):
+            now = self.q0
+            now.poll += 1
+            for j in range(offsets[i], offsets[i + 1]):
+                key = (now, gives[j], reaps[j])
+                trani = edges.get(key)
+                if not trani:
+                    give, reap = corpus.sigma[gives[j]], corpus.gamma[reaps[j]]
+                    trani = now.seek_after(give, reap)
+                    if trani:
+                        edges[key] = trani
+                if not trani:
+                    fresh = Transition(Message(give, minors[j][0], reap, minors[j][1]), now, table = self.table)
+                    now, temp = self.build_transition(fresh)
+                    edges[key] = fresh
+                    continue
+                # 与build_transition中已经存在相同转移的处理相同。
+                trani.poll += 1
+                trani.end.poll += 1
+                trani.minors.append(minors[j])
+                now = trani.end
 
     def _compatible_test(self, red, blue, level):
         '''
         判断两个节点是否兼容。
         ∀b'满足τ(b, i) = (o, b')，如果∃r'满足τ(r, i) = (o, r')，那么r和b是包容的。
+        使用栈代替递归。level大于1的结果记录在compatibles中，状态合并时由_forget_compatible删除受影响的结果；
+        level为1时只需比较离开转移的主要字段集合，直接计算。
         :type red, blue: State。
         :return: 是否兼容。
         '''
         if not level:
             return True
+        # 没有离开转移的blue不兼容；blue的离开转移的主要字段不是red的子集时不兼容。
+        if not blue.after or not blue.after_index.keys() <= red.after_index.keys():
+            return False
+        if level == 1:
+            return True
+        key = (red, blue, level)
+        if key in self.compatibles:
+            self.compatible_hits[level] += 1
+            return self.compatibles[key]
+        self.compatible_misses[level] += 1
+        # 栈帧：[键, blue的离开转移的迭代器, 目前是否兼容]。
+        frames = [[key, iter(list(blue.after)), True]]
         result = False
-        for afterb in blue.after:
-            result = False
-            for aftera in red.after:
-                if (aftera.give, aftera.reap) == (afterb.give, afterb.reap):
-                    result = self._compatible_test(aftera.end, afterb.end, level - 1)
-                    break
-            if not result:
-                return False
+        while frames:
+            frame = frames[-1]
+            (redi, bluei, leveli), afters = frame[0], frame[1]
+            afterb = next(afters, None) if frame[2] else None
+            if afterb:
+                reda, blueb = redi.after_index[(afterb.give, afterb.reap)].end, afterb.end
+                if not blueb.after or not blueb.after_index.keys() <= reda.after_index.keys():
+                    frame[2] = False
+                elif leveli > 2:
+                    keyi = (reda, blueb, leveli - 1)
+                    self.compatible_parents[keyi].add(frame[0])
+                    if keyi in self.compatibles:
+                        self.compatible_hits[leveli - 1] += 1
+                        frame[2] = self.compatibles[keyi]
+                    else:
+                        self.compatible_misses[leveli - 1] += 1
+                        frames.append([keyi, iter(list(blueb.after)), True])
+                continue
+            # 该层比较完毕，结果交给上一层。
+            frames.pop()
+            result = self.compatibles[frame[0]] = frame[2]
+            self.compatible_states[redi].add(frame[0])
+            self.compatible_states[bluei].add(frame[0])
+            if frames:
+                frames[-1][2] = result
         return result
 
-    def _mesh_states(self, pair: tuple[State, State]):
+    def _forget_compatible(self, states):
+        '''
+        删除与states相关的_compatible_test结果，以及所有依赖这些结果的上层结果。
+        :type states: Iterable[State]。
+        '''
+        keys = []
+        for statei in states:
+            keys.extend(self.compatible_states.pop(statei, ()))
+        while keys:
+            keyi = keys.pop()
+            self.compatibles.pop(keyi, None)
+            keys.extend(self.compatible_parents.pop(keyi, ()))
+
+    def _reset_compatible(self):
+        '''
+        每次化简开始时清空_compatible_test的结果缓存以及计数。
+        '''
+        self.compatibles.clear()
+        self.compatible_states.clear()
+        self.compatible_parents.clear()
+        self.compatible_hits.clear()
+        self.compatible_misses.clear()
+
+    def _mesh_states(self, pair: tuple[State, State], touched = None, reds = None):
         '''
         合并状态pair[1]到pair[0]中。
         :param pair: 两个状态构成的元组，约定为(red, blue)。将blue合并到red中，仅保留red状态，
         :type pair: tuple[State, State]。
+        :param touched: 集合，放入进入转移或离开转移改变了的状态，见_slim_frontier；None表示不需要。
+        :param reds: red集合，连带合并时保留其中的状态；None表示只保留q0。
         :return: 合并后的red状态。
         '''
         # 使用双向列表，便于双向弹出。
         leaves = deque([pair])
         red, blue = leaves[0]
+        # 已经合并的状态 -> 合并到的状态。存在环时同一个状态可能再次出现在leaves中，需要找到其合并后的状态。
+        merged: dict[State, State] = {}
         while leaves:
-            red, blue = leaves.popleft()
+            red, blue = [self._seek_merged(statei, merged) for statei in leaves.popleft()]
+            # 自环使得状态与自身配对，见Esptia._mesh_esptia。
+            if red == blue:
+                continue
+            # 存在环时连带合并的blue可能是q0或者red，此时反过来合并，避免q0以及red被删除。
+            if self._keep_state(blue, red, reds):
+                red, blue = blue, red
+            merged[blue] = red
+            self._forget_compatible((red, blue))
+            if touched is not None:
+                touched.update((red, blue))
+                touched.update([afterb.end for afterb in blue.after])
             # 更新red的报文计数。
             red.poll += blue.poll
             # 处理blue的进入转移，将这些转移的输出状态设置为red。
@@ -497,57 +771,161 @@ class Transducer:
                 red.before.add(beforeb)
             # 需要分类处理，因为可能状态b包容状态a，而非默认的状态a包容状态b。
             for afterb in blue.after:
-                # 标志位：afterb是否被afterr包含。
-                flag = False
-                for afterr in red.after:
-                    if (afterr.give, afterr.reap) == (afterb.give, afterb.reap):
-                        flag = True
-                        afterr.poll += afterb.poll
-                        # 合并应该选用.extend()方法。
-                        afterr.minors.extend(afterb.minors)
-                        afterb.end.before.discard(afterb)
-                        self.transitions.discard(afterb)
-                        leaves.append((afterr.end, afterb.end))
-                        break
+                # afterr存在说明afterb被afterr包含。
+                afterr = red.seek_after(afterb.give, afterb.reap)
+                if afterr:
+                    afterr.poll += afterb.poll
+                    # 合并应该选用.extend()方法。
+                    afterr.minors.extend(afterb.minors)
+                    afterb.end.before.discard(afterb)
+                    self.transitions.discard(afterb)
+                    leaves.append((afterr.end, afterb.end))
                 # 如果状态b包容状态a，那么可能出现剩余的b的离开转移，将这些转移的起点全部设置成red状态。
-                if not flag:
+                else:
                     afterb.begin = red
-                    red.after.add(afterb)
+                    red.add_after(afterb)
             self.states.discard(blue)
-        return red
+        return self._seek_merged(pair[0], merged)
+
+    def _keep_state(self, blue, red, reds):
+        '''
+        连带合并时是否应当保留blue而删除red。
+        '''
+        if blue is self.q0:
+            return True
+        return reds is not None and red is not self.q0 and blue in reds and red not in reds
+
+    @staticmethod
+    def _seek_merged(statei, merged):
+        '''
+        查找状态在一次合并中最终合并到的状态。
+        :type merged: dict[State, State]。
+        '''
+        while statei in merged:
+            statei = merged[statei]
+        return statei
 
     def slim_pretree(self, level):
         '''
         化简前缀树。
         :param level: 化简的维度。
         '''
-        reds: set[State] = {self.q0}
-        blues = self._gather_blue(reds)
-        while blues:
-            blue: State = blues.pop()
+        # 有序的red集合，按照成为red的顺序排列。
+        reds: dict[State, None] = {self.q0: None}
+        self._slim_frontier(reds, level, self._mesh_states)
+        self._replan_logo()
+
+    def _slim_frontier(self, reds, level, mesh):
+        '''
+        将blue逐个合并到red中或者成为新的red。
+        blue集合只在成为red、合并时根据改变了的状态增量更新。每次取出标志最小的blue，处理顺序不依赖集合的散列顺序。
+        red按照离开转移的主要字段集合分桶：level不为0时，只有字段集合与blue的字段集合存在包含关系的red才可能兼容，
+        只有blue的父状态的后继才可能是兄弟节点，其余的red既不会合并也不会中断循环，不需要逐个检查。
+        :param reds: 有序的red集合，dict的键，新的red添加在末尾。
+        :type reds: dict[State, None]。
+        :param level: 化简的维度。
+        :param mesh: 合并两个状态的方法，_mesh_states或者Esptia._mesh_esptia。
+        '''
+        self._reset_compatible()
+        # 状态 -> 进入转移的起点集合，状态的进入转移改变时删除。
+        parents: dict[State, set[State]] = {}
+        # blue集合，以及按照标志排序的堆；堆中失效的元素在取出时跳过。
+        blues: set[State] = set()
+        heap = []
+        # 离开转移的主要字段集合 -> red集合；red -> (字段集合, 成为red的次序)。
+        signs: dict[frozenset, set[State]] = defaultdict(set)
+        red_signs: dict[State, tuple[frozenset, int]] = {}
+        order = itertools.count()
+
+        def seek_parents(statei):
+            result = parents.get(statei)
+            if result is None:
+                result = parents[statei] = {beforei.begin for beforei in statei.before}
+            return result
+
+        def push_blue(statei):
+            if statei not in reds and statei not in blues:
+                blues.add(statei)
+                heapq.heappush(heap, (statei.logo, id(statei), statei))
+
+        def file_red(statei, rank = None):
+            # 登记red，或者在red的离开转移改变之后重新分桶。
+            if statei in red_signs:
+                sign, rank = red_signs.pop(statei)
+                signs[sign].discard(statei)
+                if not signs[sign]:
+                    del signs[sign]
+            if statei in self.states:
+                sign = frozenset(statei.after_index)
+                signs[sign].add(statei)
+                red_signs[statei] = (sign, rank)
+            else:
+                del reds[statei]
+
+        def seek_reds(statei):
+            # 可能与statei兼容或者是其兄弟节点的red，按照成为red的顺序排列。
+            if not level:
+                return list(reds)
+            sign = statei.after_index.keys()
+            results = set()
+            for signi, redsi in signs.items():
+                if sign and sign <= signi or signi and signi <= sign:
+                    results |= redsi
+            for parenti in seek_parents(statei):
+                results.update([trani.end for trani in parenti.after if trani.end in red_signs])
+            return sorted(results, key = lambda redi: red_signs[redi][1])
+
+        for redi in list(reds):
+            file_red(redi, next(order))
+        for bluei in self._gather_blue(reds):
+            push_blue(bluei)
+        while heap:
+            blue: State = heapq.heappop(heap)[2]
+            if blue not in blues:
+                continue
+            blues.discard(blue)
+            if blue not in self.states or blue in reds:
+                continue
             flag = False
-            for red in reds:
+            for red in seek_reds(blue):
                 # 如果存在red，满足red和blue是兄弟节点，则说明red和blue不应该合并。
-                if {beforebi.begin for beforebi in blue.before} & {beforeri.begin for beforeri in red.before}:
+                if not seek_parents(blue).isdisjoint(seek_parents(red)):
                     break
                 if self._compatible_test(red, blue, level) or self._compatible_test(blue, red, level):
-                    self._mesh_states((red, blue))
+                    touched = set()
+                    mesh((red, blue), touched, reds)
+                    for statei in touched:
+                        parents.pop(statei, None)
+                        if statei in red_signs:
+                            file_red(statei)
+                    # 合并可能使red获得新的离开转移，或者使状态成为red的新的后继。
+                    for statei in touched:
+                        if statei not in self.states:
+                            continue
+                        if statei in reds:
+                            for trani in statei.after:
+                                push_blue(trani.end)
+                        elif any(beforei.begin in reds for beforei in statei.before):
+                            push_blue(statei)
                     flag = True
                     break
             if not flag:
-                reds.add(blue)
-            # 此处可能更新了reds += blue，导致兄弟节点之间的合并。
-            blues = self._gather_blue(reds)
-        self._replan_logo()
+                # 此处更新了reds += blue，可能导致兄弟节点之间的合并。
+                reds[blue] = None
+                file_red(blue, next(order))
+                for trani in blue.after:
+                    push_blue(trani.end)
 
     def finish_pretree(self, diyrule = False):
         '''
         完全化前缀树。
         '''
+        # 截断之后保留的次要字段放入新的编号表，原来的编号表在所有转移截断之后释放。
+        self.table = MinorTable()
         for transitioni in self.transitions:
             transitioni.build_rules(diyrule)
             # 推断完rules之后应该释放minors，但是为了验证次要字段的长度以及作为转移的记忆元素，保留0号元素。
-            del transitioni.minors[1:]
+            transitioni.minors.truncate(1, self.table)
 
     @staticmethod
     def _gather_blue(reds, reds_aft = None):
@@ -577,6 +955,13 @@ class Transducer:
         for statei, statej in enumerate(lines):
             statej.logo = statei
 
+    def freeze(self):
+        '''
+        生成只读的数组状态机，用于推断，应在finish_pretree、learn_probabilities之后调用。
+        :rtype: FrozenTransducer。
+        '''
+        return FrozenTransducer(self)
+
     def learn_probabilities(self):
         '''
         行为概率计算。
@@ -701,8 +1086,8 @@ class Transducer:
         results = defaultdict(int)
         if not now:
             return results
-        for trani in now.after:
-            results[trani.give] += trani.poll
+        for give, trans in now.give_index.items():
+            results[give] = sum(trani.poll for trani in trans)
         results = sorted(results.items(), key = lambda resulti: (resulti[1], resulti[0]), reverse = True)
         return dict(results)
 
@@ -717,10 +1102,9 @@ class Transducer:
         results = {}
         if not now:
             return results
-        for trani in now.after:
-            # 不可能输入报文与输出报文同时相等。
-            if trani.give == give:
-                results[trani.reap] = trani.poll
+        # 不可能输入报文与输出报文同时相等。
+        for trani in now.give_index.get(give, ()):
+            results[trani.reap] = trani.poll
         results = sorted(results.items(), key = lambda resulti: (resulti[1], resulti[0]), reverse = True)
         return dict(results)
 
@@ -730,9 +1114,9 @@ class Transducer:
             return None, False
         majorb, majora = mess.look_major()
         minorsb, minorsa = mess.look_minors()
-        for trani in now.after:
-            if (trani.give, trani.reap) == (majorb, majora):
-                return trani.end, trani.check_rules(minorsb, minorsa)
+        trani = now.seek_after(majorb, majora)
+        if trani:
+            return trani.end, trani.check_rules(minorsb, minorsa)
         return None, False
 
     def depict(self, pic_text):
@@ -795,12 +1179,11 @@ class Transducer:
             return None, None, []
         crucial, ancillary = gives[0], gives[1]
         nominee: None | Transition = None
-        for transi in norm_state.after:
-            if transi.give == crucial:
-                # 对于存在多个离开转移含有相同的请求报文主要字段时，选取概率最大的一个。
-                if not nominee or (nominee and transi.poll > nominee.poll):
-                    nominee = transi
-                # 此处不验证请求报文的格式是否正确，由Transition类处理。
+        for transi in norm_state.give_index.get(crucial, ()):
+            # 对于存在多个离开转移含有相同的请求报文主要字段时，选取概率最大的一个。
+            if not nominee or (nominee and transi.poll > nominee.poll):
+                nominee = transi
+            # 此处不验证请求报文的格式是否正确，由Transition类处理。
         if nominee:
             return nominee.build_message_rule(ancillary)
         return None, None, []
@@ -829,7 +1212,7 @@ class Transducer:
         if norm_state not in self.states:
             return None, None, []
         crucial, ancillary = reaps[0], reaps[1]
-        for transi in norm_state.after:
-            if (transi.give, transi.reap) == (give, reaps[0]):
-                return transi.guess_request_by_rule(ancillary)
+        transi = norm_state.seek_after(give, crucial)
+        if transi:
+            return transi.guess_request_by_rule(ancillary)
         return None, None, []
@@ -0,0 +1,140 @@
+'''
+只读的状态机：在finish_pretree、learn_probabilities之后由Transducer.freeze生成，以数组存储状态和转移，用于推断。
+'''
+import numpy
+from daikon.rulepro import check_rules
+
+
+class FrozenTransducer:
+    '''
+    以CSR格式存储的只读状态机。状态的编号是其在logos中的下标，q0的编号为0。
+    offsets[s]:offsets[s + 1]是状态s的离开转移，按照(输入编号, 输出编号)排序。
+    数组在创建之后不再修改，可以在多个线程中同时查询。
+    '''
+
+    def __init__(self, transducer):
+        '''
+        :type transducer: automata.common.Transducer。
+        '''
+        self.protocol: str = transducer.protocol
+        # 输入、输出报文主要字段的编号到字段的映射，以及反向的映射。
+        self.sigma: list[str] = sorted(transducer.sigma)
+        self.gamma: list[str] = sorted(transducer.gamma)
+        self.sigma_index = {givei: i for i, givei in enumerate(self.sigma)}
+        self.gamma_index = {reapi: i for i, reapi in enumerate(self.gamma)}
+        states = sorted(transducer.states, key = lambda statei: (statei is not transducer.q0, statei.logo))
+        numbers = {statei: i for i, statei in enumerate(states)}
+        width = max(len(self.gamma), 1)
+        # 各状态的标志、到达计数以及结束概率。
+        self.logos = numpy.array([statei.logo for statei in states], numpy.int32)
+        self.state_polls = numpy.array([statei.poll for statei in states], numpy.int64)
+        self.endingps = numpy.array([statei.endingp for statei in states], numpy.float64)
+        # 标志 -> 状态的编号，不存在的标志为-1。_replan_logo之后标志是稠密的，直接以标志为下标。
+        self.logo_numbers = numpy.full(int(self.logos.max()) + 1 if len(states) else 0, -1, numpy.int32)
+        self.logo_numbers[self.logos] = numpy.arange(len(states), dtype = numpy.int32)
+        trans = sorted(
+            [trani for statei in states for trani in statei.after],
+            key = lambda trani: (numbers[trani.begin], self.sigma_index[trani.give], self.gamma_index[trani.reap])
+        )
+        offsets = [0] * (len(states) + 1)
+        for trani in trans:
+            offsets[numbers[trani.begin] + 1] += 1
+        for i in range(len(states)):
+            offsets[i + 1] += offsets[i]
+        self.offsets = numpy.array(offsets, numpy.int64)
+        # 各转移的输入、输出编号，离开状态，计数以及概率。
+        self.gives = numpy.array([self.sigma_index[trani.give] for trani in trans], numpy.int32)
+        self.reaps = numpy.array([self.gamma_index[trani.reap] for trani in trans], numpy.int32)
+        self.ends = numpy.array([numbers[trani.end] for trani in trans], numpy.int32)
+        self.polls = numpy.array([trani.poll for trani in trans], numpy.int64)
+        self.passps = numpy.array([trani.passp for trani in trans], numpy.float64)
+        # 查找用的键：输入编号 * len(gamma) + 输出编号，在每个状态的范围内有序。
+        self.keys = self.gives.astype(numpy.int64) * width + self.reaps
+        self.width = width
+        # 各转移的规则以及留存的标准字段，见Transition.check_rules。
+        self.rules = [list(trani.rules) for trani in trans]
+        self.samples = [trani.minors[0] if trani.minors else None for trani in trans]
+        for arrayi in (self.logos, self.logo_numbers, self.state_polls, self.endingps, self.offsets, self.gives,
+                       self.reaps, self.ends, self.polls, self.passps, self.keys):
+            arrayi.flags.writeable = False
+
+    def __str__(self):
+        return f'FrozenTransducer of protocol: {self.protocol}'
+
+    __repr__ = __str__
+
+    def __len__(self):
+        return len(self.logos)
+
+    def seek_state(self, logo = 0):
+        '''
+        获取标志为logo的状态的编号，与Transducer.seek_state对应。
+        :return: 状态的编号，不存在时为-1。
+        '''
+        return int(self.logo_numbers[logo]) if 0 <= logo < len(self.logo_numbers) else -1
+
+    def _seek(self, now, give, reap):
+        '''
+        在状态now的离开转移中查找主要字段为(give, reap)的转移。
+        :return: 转移的编号，不存在时为-1。
+        '''
+        if now < 0 or give not in self.sigma_index or reap not in self.gamma_index:
+            return -1
+        key = self.sigma_index[give] * self.width + self.gamma_index[reap]
+        begin, end = int(self.offsets[now]), int(self.offsets[now + 1])
+        i = begin + int(numpy.searchsorted(self.keys[begin:end], key))
+        return i if i < end and self.keys[i] == key else -1
+
+    def step(self, now, give, reap):
+        '''
+        状态转移，与Transducer.after_state对应，但不验证次要字段。
+        :param now: 状态的编号。
+        :param give: 输入报文主要字段。
+        :param reap: 输出报文主要字段。
+        :return: 下一个状态的编号，不存在对应的转移时为-1。
+        :rtype: int。
+        '''
+        i = self._seek(now, give, reap)
+        return int(self.ends[i]) if i >= 0 else -1
+
+    def predict(self, now, give = None):
+        '''
+        预测下一个报文，与Transducer.give_poll、Transducer.reap_poll对应。
+        :param now: 状态的编号。
+        :param give: 为None时预测输入报文，否则预测该输入报文对应的输出报文。
+        :return: 主要字段到概率的字典，按照概率从大到小排列。
+        :rtype: dict[str, float]。
+        '''
+        results = {}
+        if now < 0:
+            return results
+        begin, end = int(self.offsets[now]), int(self.offsets[now + 1])
+        if give is None:
+            for givei, passpi in zip(self.gives[begin:end].tolist(), self.passps[begin:end].tolist()):
+                results[self.sigma[givei]] = results.get(self.sigma[givei], 0) + passpi
+        elif give in self.sigma_index:
+            # 同一输入编号的转移在状态的范围内是连续的。
+            first = self.sigma_index[give] * self.width
+            head = begin + int(numpy.searchsorted(self.keys[begin:end], first))
+            tail = begin + int(numpy.searchsorted(self.keys[begin:end], first + self.width))
+            for reapi, passpi in zip(self.reaps[head:tail].tolist(), self.passps[head:tail].tolist()):
+                results[self.gamma[reapi]] = passpi
+        results = sorted(results.items(), key = lambda resulti: (resulti[1], resulti[0]), reverse = True)
+        return dict(results)
+
+    def check(self, now, mess):
+        '''
+        验证报文对并转移，与Transducer.after_state相同。
+        :param now: 状态的编号。
+        :type mess: Message。
+        :return: 下一个状态的编号（不存在对应的转移时为-1），次要字段是否符合规则。
+        :rtype: int, bool。
+        '''
+        majorb, majora = mess.look_major()
+        i = self._seek(now, majorb, majora)
+        if i < 0:
+            return -1, False
+        minorsb, minorsa = mess.look_minors()
+        if self.samples[i] is None or not self.rules[i]:
+            return int(self.ends[i]), True
+        return int(self.ends[i]), check_rules(minorsb, minorsa, self.rules[i], self.samples[i])
@@ -1,18 +1,17 @@
 from collections import deque
-from automata.common import Transition, Transducer
+from automata.common import Transducer
 
 
 class Esptia(Transducer):
     def build_esptia(self, messages, level, limit):
         poll = 0
-        reds = {self.q0}
+        # 有序的red集合，见Transducer._slim_frontier。
+        reds = {self.q0: None}
         for messagei in messages:
             now = self.q0
             now.poll += 1
             for messagej in messagei:
-                fresh = Transition(messagej, now)
-                temp, build = self.build_transition(fresh)
-                now = temp
+                now = self.build_message(now, messagej)
             poll += 1
             if poll < limit:
                 continue
@@ -23,44 +22,37 @@ class Esptia(Transducer):
         self._replan_logo()
 
     def _slim_esptia(self, reds, level):
-        blues = self._gather_blue(reds)
-        while blues:
-            bluei = blues.pop()
-            flag = False
-            for redi in reds:
-                if {beforebi.begin for beforebi in bluei.before} & {beforeri.begin for beforeri in redi.before}:
-                    break
-                if self._compatible_test(redi, bluei, level) or self._compatible_test(bluei, redi, level):
-                    self._mesh_esptia((redi, bluei))
-                    flag = True
-                    break
-            if not flag:
-                reds.add(bluei)
-            blues = self._gather_blue(reds)
+        # 两次化简之间新增的流改变了状态的离开转移，blue集合以及缓存的兼容性结果在_slim_frontier中重新建立。
+        self._slim_frontier(reds, level, self._mesh_esptia)
 
-    def _mesh_esptia(self, pair):
+    def _mesh_esptia(self, pair, touched = None, reds = None):
         leaves = deque([pair])
+        merged = {}
         while leaves:
-            redi, bluei = leaves.popleft()
+            redi, bluei = [self._seek_merged(statei, merged) for statei in leaves.popleft()]
             if redi == bluei:
                 continue
+            if self._keep_state(bluei, redi, reds):
+                redi, bluei = bluei, redi
+            merged[bluei] = redi
+            self._forget_compatible((redi, bluei))
+            if touched is not None:
+                touched.update((redi, bluei))
+                touched.update([afterb.end for afterb in bluei.after])
             redi.poll += bluei.poll
             for beforeb in bluei.before:
                 beforeb.end = redi
                 redi.before.add(beforeb)
             for afterb in bluei.after:
-                flag = False
-                for afterr in redi.after:
-                    if (afterr.give, afterr.reap) == (afterb.give, afterb.reap):
-                        flag = True
-                        afterr.poll += afterb.poll
-                        afterr.minors.extend(afterb.minors)
-                        afterb.end.before.discard(afterb)
-                        self.transitions.discard(afterb)
-                        if afterr.end != afterb.end:
-                            leaves.append((afterr.end, afterb.end))
-                        break
-                if not flag:
+                afterr = redi.seek_after(afterb.give, afterb.reap)
+                if afterr:
+                    afterr.poll += afterb.poll
+                    afterr.minors.extend(afterb.minors)
+                    afterb.end.before.discard(afterb)
+                    self.transitions.discard(afterb)
+                    if afterr.end != afterb.end:
+                        leaves.append((afterr.end, afterb.end))
+                else:
                     afterb.begin = redi
-                    redi.after.add(afterb)
+                    redi.add_after(afterb)
             self.states.discard(bluei)
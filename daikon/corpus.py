@@ -0,0 +1,280 @@
+'''
+以整数编号存储的列式报文语料，主要字段和次要字段都映射为稠密的整数编号，可以保存为.npy文件。
+'''
+import os
+import shutil
+import tempfile
+from hashlib import blake2b
+import numpy
+from os_manager import cache_cata, cache_limit
+from daikon.textpro import Message, intern_text, intern_minors, yield_message_seqs
+
+# 保存语料时的各个数组。
+corpus_arrays = (
+    'gives', 'reaps', 'polls', 'folds', 'offsets', 'give_minors', 'give_bounds', 'reap_minors', 'reap_bounds',
+    'sigma', 'gamma', 'symbols'
+)
+
+
+class Corpus:
+    '''
+    报文语料：所有流的报文首尾相接存放在一个int32数组中，offsets[i]:offsets[i + 1]是第i个流的报文。
+    次要字段按照行存放在平行的列中，give_bounds[r]:give_bounds[r + 1]是第r行的输入次要字段。
+    每个报文占1 + folds[j]行，heads[j]是第j个报文的第一行，之后是折叠的其余报文对的次要字段，见fold_message_seqs。
+    '''
+
+    def __init__(self):
+        # 输入报文主要字段的编号到字段的映射，与Transducer.sigma中的元素对应。
+        self.sigma: list[str] = []
+        # 输出报文主要字段的编号到字段的映射，与Transducer.gamma中的元素对应。
+        self.gamma: list[str] = []
+        # 次要字段的编号到字段的映射。
+        self.symbols: list[str] = []
+        # 各报文的输入、输出主要字段编号。
+        self.gives = numpy.zeros(0, numpy.int32)
+        self.reaps = numpy.zeros(0, numpy.int32)
+        # 各报文连续出现的次数，见fold_message_seqs。
+        self.polls = numpy.zeros(0, numpy.int32)
+        # 各报文折叠的其余报文对的数量，即次要字段多占的行数。
+        self.folds = numpy.zeros(0, numpy.int32)
+        # 各报文的次要字段在give_bounds、reap_bounds中的第一行，最后一个元素是总行数；由folds计算，不保存。
+        self.heads = numpy.zeros(1, numpy.int64)
+        # 各个流在gives、reaps中的起点，最后一个元素是报文总数。
+        self.offsets = numpy.zeros(1, numpy.int64)
+        # 输入、输出次要字段编号，以及各行在其中的起点。
+        self.give_minors = numpy.zeros(0, numpy.int32)
+        self.give_bounds = numpy.zeros(1, numpy.int64)
+        self.reap_minors = numpy.zeros(0, numpy.int32)
+        self.reap_bounds = numpy.zeros(1, numpy.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return self.yield_messages()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.messages(i) for i in range(*item.indices(len(self)))]
+        return self.messages(item)
+
+    @classmethod
+    def build_corpus(cls, arrays):
+        '''
+        由报文序列构建语料，字段按照第一次出现的顺序编号。
+        :param arrays: 报文序列，可以是生成器。
+        :type arrays: list[list[Message]]。
+        :rtype: Corpus。
+        '''
+        corpus = Corpus()
+        sigmas, gammas, symbols = {}, {}, {}
+        gives, reaps, polls, folds, offsets = [], [], [], [], [0]
+        give_minors, give_bounds, reap_minors, reap_bounds = [], [0], [], [0]
+        for arrayi in arrays:
+            for arrayj in arrayi:
+                give, reap = arrayj.look_major()
+                gives.append(sigmas.setdefault(give, len(sigmas)))
+                reaps.append(gammas.setdefault(reap, len(gammas)))
+                polls.append(arrayj.poll)
+                folds.append(len(arrayj.folds))
+                for minorsb, minorsa in arrayj.look_folds() if arrayj.folds else (arrayj.look_minors(),):
+                    give_minors.extend([symbols.setdefault(minori, len(symbols)) for minori in minorsb])
+                    give_bounds.append(len(give_minors))
+                    reap_minors.extend([symbols.setdefault(minori, len(symbols)) for minori in minorsa])
+                    reap_bounds.append(len(reap_minors))
+            offsets.append(len(gives))
+        corpus.sigma, corpus.gamma, corpus.symbols = list(sigmas), list(gammas), list(symbols)
+        corpus.gives, corpus.reaps = numpy.array(gives, numpy.int32), numpy.array(reaps, numpy.int32)
+        corpus.polls = numpy.array(polls, numpy.int32)
+        corpus.folds = numpy.array(folds, numpy.int32)
+        corpus.plan_heads()
+        corpus.offsets = numpy.array(offsets, numpy.int64)
+        corpus.give_minors = numpy.array(give_minors, numpy.int32)
+        corpus.give_bounds = numpy.array(give_bounds, numpy.int64)
+        corpus.reap_minors = numpy.array(reap_minors, numpy.int32)
+        corpus.reap_bounds = numpy.array(reap_bounds, numpy.int64)
+        return corpus
+
+    def plan_heads(self):
+        '''
+        由folds计算heads。
+        '''
+        self.heads = numpy.zeros(len(self.folds) + 1, numpy.int64)
+        numpy.cumsum(self.folds.astype(numpy.int64) + 1, out = self.heads[1:])
+
+    def look_minors(self, j):
+        '''
+        获取第j个报文的次要字段，与Message.look_minors相同。
+        :rtype: tuple[tuple, tuple]。
+        '''
+        symbols, r = self.symbols, int(self.heads[j])
+        return (
+            tuple([symbols[minori] for minori in self.give_minors[self.give_bounds[r]:self.give_bounds[r + 1]].tolist()]),
+            tuple([symbols[minori] for minori in self.reap_minors[self.reap_bounds[r]:self.reap_bounds[r + 1]].tolist()])
+        )
+
+    def minor_pairs(self):
+        '''
+        一次性还原所有行的次要字段，相同编号序列的次要字段共享一个元组；没有折叠的报文对时即各报文的次要字段。
+        :rtype: list[tuple[tuple, tuple]]。
+        '''
+        symbols, tuples = self.symbols, {}
+
+        def restore(minors, bounds):
+            results = []
+            for begin, end in zip(bounds, bounds[1:]):
+                ids = tuple(minors[begin:end])
+                minori = tuples.get(ids)
+                if minori is None:
+                    minori = tuples[ids] = tuple([symbols[idi] for idi in ids])
+                results.append(minori)
+            return results
+
+        return list(zip(restore(self.give_minors.tolist(), self.give_bounds.tolist()),
+                        restore(self.reap_minors.tolist(), self.reap_bounds.tolist())))
+
+    def messages(self, i):
+        '''
+        还原第i个流的报文序列。
+        :rtype: list[Message]。
+        '''
+        return next(self.yield_messages([i]))
+
+    def yield_messages(self, indexes = None, block = 4096):
+        '''
+        按顺序还原流的报文序列。每次将block个流的数组一起转换为列表，相同编号序列的次要字段共享一个元组。
+        :param indexes: 流的下标，按照给出的顺序产出；None表示全部。
+        :return: list[Message]生成器。
+        '''
+        sigma, gamma, symbols, tuples = self.sigma, self.gamma, self.symbols, {}
+
+        def restore(minors, bounds):
+            results = []
+            for begin, end in zip(bounds, bounds[1:]):
+                ids = tuple(minors[begin - bounds[0]:end - bounds[0]])
+                minori = tuples.get(ids)
+                if minori is None:
+                    minori = tuples[ids] = intern_minors([symbols[idi] for idi in ids])
+                results.append(minori)
+            return results
+
+        indexes = range(len(self)) if indexes is None else list(indexes)
+        for head in range(0, len(indexes), block):
+            chosen = indexes[head:head + block]
+            # 连续的下标一起转换，否则逐个流转换。
+            spans = [(chosen[0], chosen[-1] + 1)] if chosen[-1] - chosen[0] + 1 == len(chosen) else \
+                [(i, i + 1) for i in chosen]
+            for first, last in spans:
+                begin, end = int(self.offsets[first]), int(self.offsets[last])
+                offsets = self.offsets[first:last + 1].tolist()
+                heads = self.heads[begin:end + 1].tolist()
+                give_bounds = self.give_bounds[heads[0]:heads[-1] + 1].tolist()
+                reap_bounds = self.reap_bounds[heads[0]:heads[-1] + 1].tolist()
+                minorsb = restore(self.give_minors[give_bounds[0]:give_bounds[-1]].tolist(), give_bounds)
+                minorsa = restore(self.reap_minors[reap_bounds[0]:reap_bounds[-1]].tolist(), reap_bounds)
+                gives, reaps = self.gives[begin:end].tolist(), self.reaps[begin:end].tolist()
+                polls = self.polls[begin:end].tolist()
+                # 第j个报文的第一行在minorsb、minorsa中的下标，以及其后折叠的行。
+                rows = [head - heads[0] for head in heads]
+                for i in range(last - first):
+                    yield [
+                        Message(sigma[gives[j]], minorsb[rows[j]], gamma[reaps[j]], minorsa[rows[j]], polls[j],
+                                list(zip(minorsb[rows[j] + 1:rows[j + 1]], minorsa[rows[j] + 1:rows[j + 1]])) if
+                                rows[j + 1] - rows[j] > 1 else ())
+                        for j in range(offsets[i] - begin, offsets[i + 1] - begin)
+                    ]
+
+    def save_corpus(self, corpus_cata):
+        '''
+        将语料保存为目录中的.npy文件，字段映射保存为字符串数组，读取时不需要pickle。
+        :param corpus_cata: 保存语料的目录。
+        '''
+        os.makedirs(corpus_cata, exist_ok = True)
+        for logoi in corpus_arrays:
+            valuei = getattr(self, logoi)
+            if isinstance(valuei, list):
+                valuei = numpy.array(valuei, dtype = numpy.str_) if valuei else numpy.zeros(0, numpy.str_)
+            numpy.save(os.path.join(corpus_cata, f'{logoi}.npy'), valuei, allow_pickle = False)
+
+    @classmethod
+    def load_corpus(cls, corpus_cata, mmap_mode = None):
+        '''
+        读取save_corpus保存的语料。
+        :param mmap_mode: 见numpy.load，为'r'时整数数组以内存映射的方式读取。
+        :rtype: Corpus。
+        '''
+        corpus = Corpus()
+        for logoi in corpus_arrays:
+            # 较早保存的语料没有polls、folds，即没有折叠的报文对。
+            if logoi in ('polls', 'folds') and not os.path.exists(os.path.join(corpus_cata, f'{logoi}.npy')):
+                setattr(corpus, logoi, numpy.full(len(corpus.gives), 1 if logoi == 'polls' else 0, numpy.int32))
+                continue
+            if logoi in ('sigma', 'gamma', 'symbols'):
+                valuei = numpy.load(os.path.join(corpus_cata, f'{logoi}.npy'), allow_pickle = False)
+                setattr(corpus, logoi, [intern_text(str(valuej)) for valuej in valuei.tolist()])
+            else:
+                setattr(corpus, logoi, numpy.load(os.path.join(corpus_cata, f'{logoi}.npy'), mmap_mode,
+                                                  allow_pickle = False))
+        corpus.plan_heads()
+        return corpus
+
+
+def corpus_key(handle_text):
+    '''
+    缓存的键：由处理文件的路径、大小、修改时间以及内容的散列值共同确定。
+    :rtype: str。
+    '''
+    status = os.stat(handle_text)
+    digest = blake2b(f'{os.path.abspath(handle_text)}|{status.st_size}|{status.st_mtime_ns}'.encode(),
+                     digest_size = 16)
+    with open(handle_text, 'rb') as text:
+        while True:
+            block = text.read(1 << 20)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def evict_corpus(corpus_cata = cache_cata, limit = cache_limit):
+    '''
+    缓存目录超过大小上限时，按照最近使用的时间从旧到新删除缓存。
+    '''
+    entries = []
+    for entryi in os.scandir(corpus_cata):
+        # 跳过正在写入的临时目录。
+        if not entryi.is_dir() or entryi.name.startswith('.'):
+            continue
+        size = sum(filei.stat().st_size for filei in os.scandir(entryi.path))
+        entries.append((entryi.stat().st_mtime, size, entryi.path))
+    total = sum(entryi[1] for entryi in entries)
+    for stamp, size, road in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(road, ignore_errors = True)
+        total -= size
+
+
+def cache_corpus(handle_text, corpus_cata = cache_cata, limit = cache_limit):
+    '''
+    读取处理文件对应的缓存语料；缓存不存在时解析处理文件并写入缓存，再按照大小上限淘汰旧的缓存。
+    :param corpus_cata: 缓存目录。
+    :param limit: 缓存目录的大小上限，单位为字节。
+    :rtype: Corpus，整数数组以内存映射的方式读取。
+    '''
+    road = os.path.join(corpus_cata, corpus_key(handle_text))
+    if os.path.isdir(road):
+        # 更新最近使用的时间。
+        os.utime(road)
+        return Corpus.load_corpus(road, 'r')
+    os.makedirs(corpus_cata, exist_ok = True)
+    # 先写入临时目录再改名，避免其他进程读到不完整的缓存。
+    temp = tempfile.mkdtemp(dir = corpus_cata, prefix = '.')
+    Corpus.build_corpus(yield_message_seqs(handle_text)).save_corpus(temp)
+    try:
+        os.rename(temp, road)
+    except OSError:
+        shutil.rmtree(temp, ignore_errors = True)
+    corpus = Corpus.load_corpus(road, 'r')
+    evict_corpus(corpus_cata, limit)
+    return corpus
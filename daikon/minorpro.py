@@ -0,0 +1,354 @@
+'''
+转移次要字段的列式存储：每个a{i}、b{i}字段一列，字段值驻留为整数编号。
+编号表MinorTable由创建Minors的一方（如状态机）持有并传入，不再被引用时随之释放，不存在进程级的编号表。
+'''
+import atexit
+import json
+import os
+import shutil
+import tempfile
+from array import array
+from os_manager import spill_cata, spill_limit
+
+# 写入CSV时需要被转译的内容。
+# replace('\r', '').replace('\n', '').replace(',', '').replace('"', '\'')。
+csv_translate = str.maketrans('\r\n,"', '   \'')
+# 合并时行数不少于该值的MinorBlock直接共享，否则复制其字段编号，避免产生大量很小的MinorBlock。
+minor_share = 1 << 10
+
+
+class MinorTable:
+    '''
+    次要字段值的编号表，同一个编号表中的Minors可以直接共享MinorBlock。
+    '''
+    __slots__ = ('symbols', 'numbers', '__weakref__')
+
+    def __init__(self):
+        # 次要字段值的编号到值的映射，以及反向的映射。
+        self.symbols: list[str] = []
+        self.numbers: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def intern(self, minor):
+        '''
+        获取次要字段值的编号，第一次出现时分配新的编号。
+        :rtype: int。
+        '''
+        number = self.numbers.get(minor)
+        if number is None:
+            number = self.numbers[minor] = len(self.symbols)
+            self.symbols.append(minor)
+        return number
+
+
+class MinorBlock:
+    '''
+    长度相同的连续若干行次要字段，columns[i]是第i列的字段编号。
+    '''
+    __slots__ = ('shape', 'columns', 'size')
+
+    def __init__(self, shape):
+        # (输入次要字段长度, 输出次要字段长度)。
+        self.shape: tuple[int, int] = shape
+        self.columns = [array('i') for _ in range(shape[0] + shape[1])]
+        self.size = 0
+
+    def append(self, givei, reapi, table):
+        for columni, minori in zip(self.columns, (*givei, *reapi)):
+            columni.append(table.intern(minori))
+        self.size += 1
+
+    def row(self, i, table):
+        cells = [table.symbols[columni[i]] for columni in self.columns]
+        return tuple(cells[:self.shape[0]]), tuple(cells[self.shape[0]:])
+
+
+class Minors:
+    '''
+    转移的次要字段集合，可以代替list[tuple[tuple, tuple]]：支持append、extend、len、迭代、[i]以及del [i:]。
+    行按照加入的顺序存放在若干MinorBlock中，extend同一个编号表的Minors时直接接上其MinorBlock，不复制字段。
+    '''
+    __slots__ = ('blocks', 'size', 'sealed', 'table')
+
+    def __init__(self, rows = (), table = None):
+        self.blocks: list[MinorBlock] = []
+        self.size = 0
+        # 最后一个MinorBlock与其他Minors共享，此时不能继续在其中添加行。
+        self.sealed = False
+        # 字段编号所在的编号表，默认为只属于该集合的新编号表。
+        self.table: MinorTable = MinorTable() if table is None else table
+        self.extend(rows)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for blocki in self.blocks:
+            for i in range(blocki.size):
+                yield blocki.row(i, self.table)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(self)[item]
+        if item < 0:
+            item += self.size
+        if not 0 <= item < self.size:
+            raise IndexError('Minors index out of range')
+        for blocki in self.blocks:
+            if item < blocki.size:
+                return blocki.row(item, self.table)
+            item -= blocki.size
+
+    def __delitem__(self, item):
+        if isinstance(item, slice) and item.stop is None and item.step in (None, 1):
+            # 截断为前若干行，例如finish_pretree中的del minors[1:]。
+            rows = [self[i] for i in range(item.indices(self.size)[0])]
+        else:
+            rows = list(self)
+            del rows[item]
+        self._refill(rows, self.table)
+
+    def __eq__(self, other):
+        if isinstance(other, (Minors, list, tuple)):
+            return len(self) == len(other) and all(rowi == rowj for rowi, rowj in zip(self, other))
+        return NotImplemented
+
+    def __str__(self):
+        return str(list(self))
+
+    __repr__ = __str__
+
+    def _refill(self, rows, table):
+        '''
+        清空后在编号表table中重新添加rows，不再共享原来的MinorBlock。
+        '''
+        self.blocks, self.size, self.sealed, self.table = [], 0, False, table
+        self.extend(rows)
+
+    def truncate(self, size, table = None):
+        '''
+        只保留前size行，例如finish_pretree中只保留第0行。
+        :param table: 保留的行放入的编号表，默认不变；放入新的编号表之后，原来的编号表不再被引用时随之释放。
+        '''
+        self._refill([self[i] for i in range(min(size, self.size))], self.table if table is None else table)
+
+    def _tail(self, shape):
+        '''
+        获取可以添加行的最后一个MinorBlock。
+        '''
+        if self.sealed or not self.blocks or self.blocks[-1].shape != shape:
+            self.blocks.append(MinorBlock(shape))
+            self.sealed = False
+        return self.blocks[-1]
+
+    def append(self, minor):
+        '''
+        添加一行次要字段。
+        :type minor: tuple[tuple, tuple]。
+        '''
+        givei, reapi = minor
+        self._tail((len(givei), len(reapi))).append(givei, reapi, self.table)
+        self.size += 1
+
+    def extend(self, rows):
+        '''
+        添加多行次要字段。rows是同一个编号表的Minors时接上其较大的MinorBlock，两者之后都不再修改共享的MinorBlock；
+        较小的MinorBlock复制字段编号。
+        :type rows: Minors | list[tuple[tuple, tuple]]。
+        '''
+        # SpillMinors的行不全在MinorBlock中，其他编号表的字段编号不能直接使用，逐行添加。
+        if type(rows) is not Minors or rows.table is not self.table:
+            for rowi in rows:
+                self.append(rowi)
+            return
+        for blocki in list(rows.blocks):
+            if blocki.size >= minor_share:
+                self.blocks.append(blocki)
+                self.sealed = rows.sealed = True
+                continue
+            tail = self._tail(blocki.shape)
+            for columni, columnj in zip(tail.columns, blocki.columns):
+                columni.extend(columnj)
+            tail.size += blocki.size
+        self.size += rows.size
+
+    def write_csv(self, csvtext):
+        '''
+        按照build_rules需要的格式写入CSV：标题为a0, a1, ..., b0, b1, ...，每行一组次要字段。
+        :param csvtext: 打开的文本文件。
+        :return: 各行的次要字段长度是否相同，不同或者没有行时不写入。
+        :rtype: bool。
+        '''
+        if len({blocki.shape for blocki in self.blocks}) != 1:
+            return False
+        minoral, minorbl = self.blocks[0].shape
+        csvtext.write(','.join([f'a{ai}' for ai in range(minoral)] + [f'b{bi}' for bi in range(minorbl)]) + '\n')
+        # 字段编号 -> 转译之后的字段。
+        letters = {}
+        for blocki in self.blocks:
+            if not blocki.columns:
+                csvtext.write('\n' * blocki.size)
+                continue
+            for numbers in zip(*blocki.columns):
+                cells = []
+                for numberi in numbers:
+                    letteri = letters.get(numberi)
+                    if letteri is None:
+                        letteri = letters[numberi] = str(self.table.symbols[numberi]).translate(csv_translate)
+                    cells.append(letteri)
+                csvtext.write(','.join(cells) + '\n')
+        return True
+
+
+class SpillMinors(Minors):
+    '''
+    溢出到磁盘的次要字段集合：缓冲的行超过limit行时，以JSON Lines格式追加到该转移自己的段文件中。
+    行的顺序为segments中的各段，然后是内存中缓冲的行。合并时接上另一个集合的段文件，不复制数据。
+    缓冲的行直接保存字段值，不经过编号表，内存只与limit有关。第0行始终保留在内存中，见Transition.check_rules。
+    '''
+    __slots__ = ('segments', 'spilled', 'own', 'head', 'shapes', 'limit', 'pending')
+
+    def __init__(self, rows = (), limit = spill_limit):
+        # 段文件以及其中的行数。
+        self.segments: list[tuple[str, int]] = []
+        self.spilled = 0
+        # 正在追加的段文件，接上其他集合的段文件之后需要新建。
+        self.own: str | None = None
+        self.head = None
+        # 各行的(输入次要字段长度, 输出次要字段长度)。
+        self.shapes: set[tuple[int, int]] = set()
+        self.limit = limit
+        # 还没有写入段文件的行。
+        self.pending: list[tuple[tuple, tuple]] = []
+        # 不使用MinorBlock以及编号表。
+        self.blocks, self.size, self.sealed, self.table = [], 0, False, None
+        self.extend(rows)
+
+    def __iter__(self):
+        for road, size in self.segments:
+            with open(road, 'r', encoding = 'utf-8') as segment:
+                for line in segment:
+                    givei, reapi = json.loads(line)
+                    yield tuple(givei), tuple(reapi)
+        yield from self.pending
+
+    def __getitem__(self, item):
+        if item == 0 and self.head is not None:
+            return self.head
+        if isinstance(item, slice):
+            return list(self)[item]
+        if item < 0:
+            item += self.size
+        if not 0 <= item < self.size:
+            raise IndexError('Minors index out of range')
+        if item >= self.spilled:
+            return self.pending[item - self.spilled]
+        for i, rowi in enumerate(self):
+            if i == item:
+                return rowi
+
+    def __delitem__(self, item):
+        if isinstance(item, slice) and item.stop is None and item.step in (None, 1):
+            rows = [self[i] for i in range(item.indices(self.size)[0])]
+        else:
+            rows = list(self)
+            del rows[item]
+        # 段文件只属于合并后的集合，此时删除。
+        for road in {road for road, size in self.segments}:
+            if os.path.exists(road):
+                os.remove(road)
+        self.segments, self.spilled, self.own, self.head, self.shapes = [], 0, None, None, set()
+        self.pending, self.size = [], 0
+        self.extend(rows)
+
+    def truncate(self, size, table = None):
+        '''
+        只保留前size行，同时删除段文件；缓冲的行不使用编号表，忽略table。
+        '''
+        del self[size:]
+
+    def append(self, minor):
+        givei, reapi = minor
+        row = (tuple(givei), tuple(reapi))
+        if self.head is None:
+            self.head = row
+        self.shapes.add((len(givei), len(reapi)))
+        self.pending.append(row)
+        self.size += 1
+        if len(self.pending) >= self.limit:
+            self.spill()
+
+    def extend(self, rows):
+        if not isinstance(rows, SpillMinors):
+            for rowi in rows:
+                self.append(rowi)
+            return
+        if not rows.size:
+            return
+        # 先写出双方缓冲的行，保证行的顺序，再接上rows的段文件。
+        self.spill()
+        rows.spill()
+        self.segments.extend(list(rows.segments))
+        self.spilled += rows.spilled
+        self.size += rows.size
+        self.shapes |= rows.shapes
+        if self.head is None:
+            self.head = rows.head
+        self.own = rows.own = None
+
+    def spill(self):
+        '''
+        将内存中缓冲的行追加到段文件。
+        '''
+        if not self.pending:
+            return
+        if not self.own:
+            fd, self.own = tempfile.mkstemp(suffix = '.jsonl', dir = spill_holder())
+            os.close(fd)
+            self.segments.append((self.own, 0))
+        # 字段值 -> JSON格式，只在本次写入中使用。
+        letters = {}
+        with open(self.own, 'a', encoding = 'utf-8') as segment:
+            for givei, reapi in self.pending:
+                cells = []
+                for minori in (*givei, *reapi):
+                    letteri = letters.get(minori)
+                    if letteri is None:
+                        letteri = letters[minori] = json.dumps(minori, ensure_ascii = False)
+                    cells.append(letteri)
+                segment.write(f'[[{",".join(cells[:len(givei)])}],[{",".join(cells[len(givei):])}]]\n')
+        road, size = self.segments[-1]
+        self.segments[-1] = (road, size + len(self.pending))
+        self.spilled = self.size
+        self.pending = []
+
+    def write_csv(self, csvtext):
+        '''
+        与Minors.write_csv相同，逐行读取段文件写入。
+        '''
+        if len(self.shapes) != 1:
+            return False
+        minoral, minorbl = next(iter(self.shapes))
+        csvtext.write(','.join([f'a{ai}' for ai in range(minoral)] + [f'b{bi}' for bi in range(minorbl)]) + '\n')
+        for givei, reapi in self:
+            csvtext.write(','.join([str(minori).translate(csv_translate) for minori in (*givei, *reapi)]) + '\n')
+        return True
+
+
+# 本进程的段文件目录，第一次溢出时创建，进程结束时删除。
+spill_holders: list[str] = []
+
+
+def spill_holder():
+    '''
+    获取本进程的段文件目录。
+    :rtype: str。
+    '''
+    if not spill_holders:
+        if spill_cata:
+            os.makedirs(spill_cata, exist_ok = True)
+        spill_holders.append(tempfile.mkdtemp(prefix = 'minors-', dir = spill_cata))
+        atexit.register(shutil.rmtree, spill_holders[0], True)
+    return spill_holders[0]
@@ -3,38 +3,24 @@ import pandas
 from re import compile
 from os_manager import csv_road, perl_road, jar_road, decls_road, dtrace_road, loss_minor
 from automata.rules import Rule
+from daikon.minorpro import Minors
 
 
 def build_rules(minors, diyrule = False):
     '''
     调用规则监视器产生规则。
     :param minors: 规则监视器需要的字段集合。
+    :type minors: Minors | list[tuple[tuple, tuple]]。
     :param diyrule: 是否添加额外的自定义规则。
     :return: 格式化后的规则。
     '''
-    # 请求次要字段长度、响应次要字段长度。
-    minoral, minorbl = len(minors[0][0]), len(minors[0][1])
-    # 列名。
-    titles = [f'a{ai}' for ai in range(minoral)] + [f'b{bi}' for bi in range(minorbl)]
-    # 需要被转译的CSV内容。
-    # replace('\r', '').replace('\n', '').replace(',', '').replace('"', '\'')。
-    csv_translate = str.maketrans('\r\n,"', '   \'')
+    if not isinstance(minors, Minors):
+        minors = Minors(minors)
     with (open(csv_road, 'w', encoding = 'utf-8') as csvtext):
-        # 写入标题。
-        csvtext.write(','.join(titles) + '\n')
-        for minori in minors:
-            givei, reapi = minori[0], minori[1]
-            # 如果次要字段长度不同则直接不做判断。
-            if (len(givei), len(reapi)) != (minoral, minorbl):
-                print(f'#common.py: (72) Length Of Minors Not Equal\n')
-                return []
-            # 处理换行符、','等特殊字符。
-            letters = ','.join([givej.translate(csv_translate) for givej in givei]) if givei else ''
-            if reapi:
-                if letters:
-                    letters += ','
-                letters += ','.join([reapj.translate(csv_translate) for reapj in reapi])
-            csvtext.write(letters + '\n')
+        # 如果次要字段长度不同则直接不做判断。
+        if not minors.write_csv(csvtext):
+            print(f'#common.py: (72) Length Of Minors Not Equal\n')
+            return []
     result: list[Rule] = call_daikon()
     if diyrule:
         diy_rules(result)
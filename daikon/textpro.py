@@ -1,23 +1,62 @@
-from os_manager import split_logo, stream_logo, loss_logo, loss_minor
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from mmap import mmap, ACCESS_READ
+from os_manager import split_logo, stream_logo, loss_logo, loss_minor, content_logo
+from file_manager import open_handle
+
+# 默认的主要字段λ。
+lambda_major = sys.intern(chr(955))
+# 缺失次要字段时共享的元组。
+loss_minors = (sys.intern(loss_minor),)
+
+
+def intern_text(text):
+    '''
+    驻留字符串，其他类型的字段保持不变。
+    '''
+    return sys.intern(str(text)) if isinstance(text, str) else text
+
+
+def intern_minors(minors):
+    '''
+    将次要字段转换为元组，字符串使用sys.intern驻留，相同的字段值在所有报文中共享一个对象。
+    :type minors: list | tuple。
+    :rtype: tuple。
+    '''
+    if not minors or not isinstance(minors, (list, tuple)):
+        return ()
+    if len(minors) == 1 and minors[0] == loss_minor:
+        return loss_minors
+    return tuple(intern_text(minori) for minori in minors)
 
 
 class Message:
     '''
     输入报文和输出报文格式对。
+    使用__slots__，次要字段是元组，字符串经过驻留，大量重复的报文字段只占用一份内存。
     '''
+    __slots__ = ('give_major', 'give_minors', 'reap_major', 'reap_minors', 'poll', 'folds')
 
-    def __init__(self):
+    def __init__(self, give_major = lambda_major, give_minors = (), reap_major = lambda_major, reap_minors = (),
+                 poll = 1, folds = ()):
         # 输入报文的主要部分，具体表现为标识头、响应码等，默认为λ。
-        self.give_major = chr(955)
-        # 输入报文的其他参数，是有序列表。
-        self.give_minors = []
+        self.give_major = give_major
+        # 输入报文的其他参数，是有序元组。
+        self.give_minors = give_minors
         # 输出报文的主要部分，具体表现为标识头、响应码等，默认为λ。
-        self.reap_major = chr(955)
-        # 输出报文的其他参数，是有序列表。
-        self.reap_minors = []
+        self.reap_major = reap_major
+        # 输出报文的其他参数，是有序元组。
+        self.reap_minors = reap_minors
+        # 连续出现的次数，大于1时表示折叠的报文对，见fold_message_seqs。
+        self.poll = poll
+        # 折叠的报文对中第2个及之后的报文对的次要字段(give_minors, reap_minors)，共poll - 1个。
+        self.folds: list[tuple[tuple, tuple]] | tuple = folds
 
     def __str__(self):
-        return f'{self.give_major}: {self.give_minors} --> \n\t\t{self.reap_major}: {self.reap_minors}\n'
+        folds = f' * {self.poll}' if self.poll > 1 else ''
+        return f'{self.give_major}: {list(self.give_minors)} --> \n\t\t{self.reap_major}: {list(self.reap_minors)}{folds}\n'
 
     __repr__ = __str__
 
@@ -31,18 +70,11 @@ class Message:
     def build_mespair(cls, give_major = chr(955), give_minors = None, reap_major = chr(955), reap_minors = None):
         '''
         实现对输入/输出报文对缺失的补充，返回合法的类实例。
+        :param give_minors, reap_minors: 次要字段，列表或者元组。
         :return: Message实例。
         '''
-        if not give_minors or not isinstance(give_minors, list):
-            give_minors = []
-        if not reap_minors or not isinstance(reap_minors, list):
-            reap_minors = []
-        mespair = Message()
-        mespair.give_major = give_major
-        mespair.give_minors = give_minors
-        mespair.reap_major = reap_major
-        mespair.reap_minors = reap_minors
-        return mespair
+        return Message(intern_text(give_major), intern_minors(give_minors),
+                       intern_text(reap_major), intern_minors(reap_minors))
 
     def look_major(self):
         '''
@@ -58,47 +90,244 @@ class Message:
         '''
         return self.give_minors, self.reap_minors
 
+    def look_folds(self):
+        '''
+        获取折叠的各个报文对的次要字段，第一个是look_minors的结果。
+        :rtype: list[tuple[tuple, tuple]]。
+        '''
+        return [(self.give_minors, self.reap_minors), *self.folds]
+
 
-def build_message_seqs(handle_text):
+def parse_line(line: str):
     '''
-    读取处理文件，构建Message对列表。
-    :param handle_text: 处理文件的完整路径。
-    :rtype: list[list[Message]]。
+    解析处理文件的一行（不含换行符），得到主要字段与次要字段。
+    :return: (主要字段, 次要字段)。
+    '''
+    if line == loss_logo:
+        return lambda_major, loss_minors
+    line_splits = line.split(':', 1)
+    major, tempminors = line_splits[0], ''
+    if len(line_splits) > 1:
+        tempminors = line_splits[1]
+    minors = loss_minors if not tempminors or tempminors == ' ' else tempminors.split(split_logo)
+    return major, minors
+
+
+def build_flow_messages(lines):
     '''
+    直接由一个TCP流的各行（不含换行符和流分隔符，见StreamFlow.lines）构建Message对列表，不经过处理文件。
+    各行按照请求、响应成对排列，见handle_common.pair_messages；结果与parse_message_seqs解析写入的同一个流相同。
+    :param lines: 字符串列表。
+    :rtype: list[Message]。
+    '''
+    results = []
+    for i in range(0, len(lines) - 1, 2):
+        tempi, tempj = parse_line(lines[i]), parse_line(lines[i + 1])
+        results.append(Message.build_mespair(tempi[0], tempi[1], tempj[0], tempj[1]))
+    return results
 
-    def handle_line(line: str):
-        if line == loss_logo:
-            return chr(955), [loss_minor]
-        line_splits = line.split(':', 1)
-        major, tempminors = line_splits[0], ''
-        if len(line_splits) > 1:
-            tempminors = line_splits[1]
-        minors = [loss_minor] if not tempminors or tempminors == ' ' else tempminors.split(split_logo)
-        return major, minors
-
-    # 读取处理文件。
-    with open(handle_text, 'r') as text:
-        lines = text.readlines()
-    results, resulti = [], []
-    i, linel = 0, len(lines)
+
+def parse_message_seqs(lines, aligns = None):
+    '''
+    逐行解析处理文件的内容，每遇到一个流分隔符产出一个Message对列表，与build_message_seqs的结果相同。
+    :param lines: 以换行符结尾的行，可以是文件对象、生成器等。
+    :param aligns: 列表，解析结束时放入是否恰好停在流分隔符处，即之后的内容可以独立解析；None表示不需要。
+    :return: list[Message]生成器。
+    '''
+    resulti, linei = [], None
     # 一次处理两行。
-    while i < linel:
-        # 由于冗余的流分隔符导致的特例。
-        if i + 1 >= linel:
-            break
+    for line in lines:
         # 去除行末的换行符。
-        linei, linej = lines[i][:-1], lines[i + 1][:-1]
-        # 流分隔符。
-        if linei == stream_logo:
-            # 将上一个流写入结果，并剔除空流。
-            if resulti:
-                results.append(resulti)
-            # 重置此次分析的流。
-            i, resulti = i + 1, []
+        line = line[:-1]
+        if linei is None:
+            # 流分隔符。
+            if line == stream_logo:
+                # 产出上一个流，并剔除空流。
+                if resulti:
+                    yield resulti
+                # 重置此次分析的流。
+                resulti = []
+                continue
+            linei = line
             continue
-        tempi, tempj = handle_line(linei), handle_line(linej)
+        # 第二行即使是流分隔符，也与第一行构成报文对。
+        tempi, tempj = parse_line(linei), parse_line(line)
         resulti.append(Message.build_mespair(tempi[0], tempi[1], tempj[0], tempj[1]))
-        i += 2
+        linei = None
+    if aligns is not None:
+        aligns.append(linei is None and not resulti)
+    # 由于冗余的流分隔符导致的特例：最后剩余的单独一行被忽略。
     if resulti:
-        results.append(resulti)
+        yield resulti
+
+
+def build_message_seqs(handle_text, cache = False, fold = False):
+    '''
+    读取处理文件，构建Message对列表。
+    :param handle_text: 处理文件的完整路径。
+    :param cache: 是否使用cache_cata中的解析结果缓存，见daikon.corpus.cache_corpus。
+    :param fold: 是否折叠连续相同的文本内容报文对，见fold_message_seqs。
+    :rtype: list[list[Message]]。
+    '''
+    if cache:
+        # daikon.corpus依赖本模块，在此处导入。
+        from daikon.corpus import cache_corpus
+        arrays = cache_corpus(handle_text)
+        return list(fold_message_seqs(arrays) if fold else arrays)
+    # 读取处理文件，压缩文件按照扩展名解压。
+    with open_handle(handle_text, 'r') as text:
+        return list(fold_message_seqs(parse_message_seqs(text)) if fold else parse_message_seqs(text))
+
+
+def fold_message_seqs(arrays, logos = (content_logo,)):
+    '''
+    行程编码：将连续出现、主要字段相同的文本内容报文对（如SMTP DATA阶段的content/$LOSS$LOGO）折叠为一个报文对，
+    poll记录连续出现的次数，第一个报文对的次要字段保存在give_minors、reap_minors中，其余的按顺序保存在folds中。
+    :param arrays: 报文序列，可以是生成器。
+    :param logos: 可以折叠的主要字段。
+    :return: list[Message]生成器。
+    '''
+    for arrayi in arrays:
+        # fold是本次新建的折叠报文对，可以直接添加folds，不修改输入的Message。
+        results, fold = [], None
+        for arrayj in arrayi:
+            last = results[-1] if results else None
+            if last and (last.give_major, last.reap_major) == (arrayj.give_major, arrayj.reap_major) and (
+                    arrayj.give_major in logos or arrayj.reap_major in logos):
+                if last is not fold:
+                    fold = results[-1] = Message(last.give_major, last.give_minors, last.reap_major,
+                                                 last.reap_minors, last.poll, list(last.folds))
+                fold.poll += arrayj.poll
+                fold.folds.extend(arrayj.look_folds())
+                continue
+            results.append(arrayj)
+        yield results
+
+
+def yield_message_seqs(handle_text):
+    '''
+    逐行读取处理文件，每次产出一个流的Message对列表，内存只与当前的流有关。
+    :param handle_text: 处理文件的完整路径。
+    :return: list[Message]生成器，与build_message_seqs的结果相同。
+    '''
+    with open_handle(handle_text, 'r') as text:
+        yield from parse_message_seqs(text)
+
+
+class MessageSeqs:
+    '''
+    处理文件中报文序列的惰性视图，每次遍历重新读取文件，可以替代build_message_seqs返回的列表进行遍历、切片以及按下标选取。
+    '''
+
+    def __init__(self, handle_text, indexes = None, cache = False):
+        # 处理文件的完整路径。
+        self.handle_text = handle_text
+        # 选取的流的下标集合，None表示全部。
+        self.indexes: frozenset[int] | None = indexes
+        # 流的数量，第一次调用len()时计算。
+        self.length = len(indexes) if indexes is not None else None
+        # 是否使用解析结果缓存，此时直接按下标读取缓存的语料，不再读取处理文件。
+        self.cache = cache
+        # 缓存的语料，第一次遍历时读取。
+        self.corpus = None
+
+    def give_corpus(self):
+        if self.corpus is None:
+            from daikon.corpus import cache_corpus
+            self.corpus = cache_corpus(self.handle_text)
+        return self.corpus
+
+    def __iter__(self):
+        if self.cache:
+            yield from self.give_corpus().yield_messages(None if self.indexes is None else sorted(self.indexes))
+            return
+        last = max(self.indexes, default = -1) if self.indexes is not None else None
+        for i, arrayi in enumerate(yield_message_seqs(self.handle_text)):
+            if last is not None and i > last:
+                return
+            if self.indexes is None or i in self.indexes:
+                yield arrayi
+
+    def __len__(self):
+        if self.length is None:
+            self.length = len(self.give_corpus()) if self.cache else sum(1 for _ in self)
+        return self.length
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('MessageSeqs only supports slices, use select() for indexes.')
+        return self.select(range(*item.indices(len(self))))
+
+    def select(self, indexes):
+        '''
+        按下标选取流，如KFold划分得到的下标数组；遍历时按照文件中的顺序产出。
+        :rtype: MessageSeqs。
+        '''
+        indexes = frozenset(int(indexi) for indexi in indexes)
+        if self.indexes is not None:
+            # 下标相对于当前视图。
+            chosen = sorted(self.indexes)
+            indexes = frozenset(chosen[indexi] for indexi in indexes)
+        seqs = MessageSeqs(self.handle_text, indexes, self.cache)
+        seqs.corpus = self.corpus
+        return seqs
+
+
+def parse_range(handle_text, begin, end):
+    '''
+    解析处理文件中[begin, end)字节范围的内容，供进程池调用。
+    :return: 报文序列，是否恰好停在流分隔符处。
+    '''
+    with open(handle_text, 'rb') as text:
+        text.seek(begin)
+        # 与open(handle_text, 'r')相同的编码和换行符处理。
+        lines = io.TextIOWrapper(io.BytesIO(text.read(end - begin if end is not None else -1)))
+        aligns = []
+        return list(parse_message_seqs(lines, aligns)), aligns[0]
+
+
+def split_stream_ranges(handle_text, parts):
+    '''
+    使用mmap查找流分隔符所在的行，将处理文件划分为大约parts个字节范围，每个范围都在流分隔符的下一行开始。
+    :rtype: list[int]，各范围的起点，第一个为0。
+    '''
+    size = os.path.getsize(handle_text)
+    begins = [0]
+    if not size:
+        return begins
+    logo = ('\n' + stream_logo + '\n').encode()
+    with open(handle_text, 'rb') as text, mmap(text.fileno(), 0, access = ACCESS_READ) as data:
+        for parti in range(1, parts):
+            found = data.find(logo, max(size * parti // parts, begins[-1], 1) - 1)
+            if found < 0:
+                break
+            border = found + len(logo)
+            if border > begins[-1] and border < size:
+                begins.append(border)
+    return begins
+
+
+def pool_message_seqs(handle_text, workers = None, least = 1 << 24):
+    '''
+    使用进程池并行解析处理文件，结果按原来的顺序排列，与build_message_seqs相同。
+    各个范围假设从流的开头开始解析；如果某个范围结束时没有恰好停在流分隔符处（例如奇数行导致报文对跨越流分隔符），
+    则从该范围开始顺序解析，保证结果确定。
+    :param workers: 进程数量，默认为CPU数量。
+    :param least: 小于该字节数的文件直接顺序解析。
+    :rtype: list[list[Message]]。
+    '''
+    workers = workers or os.cpu_count() or 1
+    # 压缩文件不能按照字节范围划分。
+    if workers == 1 or os.path.getsize(handle_text) < least or handle_text.endswith(('.gz', '.xz', '.zst')):
+        return build_message_seqs(handle_text)
+    begins = split_stream_ranges(handle_text, workers * 4)
+    ends = begins[1:] + [None]
+    results = []
+    with ProcessPoolExecutor(workers) as executor:
+        parts = executor.map(parse_range, [handle_text] * len(begins), begins, ends)
+        for begin, end, (arrays, aligned) in zip(begins, ends, parts):
+            if end is not None and not aligned:
+                results.extend(parse_range(handle_text, begin, None)[0])
+                break
+            results.extend(arrays)
     return results
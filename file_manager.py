@@ -0,0 +1,38 @@
+'''
+处理文件的读写，抓包处理（handle_*）与解析（daikon.textpro）两侧共用。
+'''
+import gzip
+import io
+import lzma
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 读写处理文件的缓冲区大小。
+handle_buffer = 1 << 20
+
+
+def open_handle(saketext, textflag = 'r'):
+    '''
+    按照扩展名打开处理文件，.gz、.xz、.zst文件以流的方式压缩、解压，其他文件直接打开，都使用较大的缓冲区。
+    :param saketext: 处理文件名称。
+    :param textflag: 文件的读写方式，如'r'、'w'、'a'。
+    :return: 文本文件对象。
+    '''
+    binflag = textflag.replace('t', '').replace('b', '') + 'b'
+    suffix = os.path.splitext(saketext)[1]
+    if suffix == '.gz':
+        raw = gzip.open(saketext, binflag)
+    elif suffix == '.xz':
+        raw = lzma.open(saketext, binflag)
+    elif suffix == '.zst':
+        if not zstandard:
+            raise ImportError('zstandard is required for .zst handle files.')
+        raw = zstandard.open(saketext, binflag)
+    else:
+        return open(saketext, textflag, buffering = handle_buffer)
+    buffered = io.BufferedReader(raw, handle_buffer) if 'r' in binflag else io.BufferedWriter(raw, handle_buffer)
+    return io.TextIOWrapper(buffered)
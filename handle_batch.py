@@ -0,0 +1,118 @@
+'''
+使用进程池批量处理多个pcap文件。
+'''
+import glob
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from os_manager import sake_cata, pcap_cata
+from file_manager import open_handle, handle_buffer
+from handle_pyshark import handle_pcap
+from handle_index import load_index
+
+
+def gather_pcaps(pcaps):
+    '''
+    整理需要处理的pcap文件。
+    :param pcaps: pcap文件名称列表或者通配符，如'ftp-lbnl-annon-*'；相对路径位于pcap_cata。
+    :rtype: list[str]。
+    '''
+    if isinstance(pcaps, str):
+        pcaps = [pcaps]
+    datatexts = []
+    for pcapi in pcaps:
+        if not os.path.isabs(pcapi):
+            pcapi = pcap_cata + pcapi
+        # 通配符按照名称排序，保证合并结果的顺序固定。
+        datatexts.extend(sorted(glob.glob(pcapi)) if glob.has_magic(pcapi) else [pcapi])
+    return datatexts
+
+
+def plan_names(datatexts):
+    '''
+    为各个pcap文件确定处理文件的名称，默认为去掉扩展名的文件名。
+    文件名相同的pcap文件（如不同目录下的x.pcap、x.pcapng）附加完整路径的短哈希，避免子进程写入同一个处理文件。
+    :rtype: list[str]。
+    '''
+    names = [os.path.splitext(os.path.basename(datatexti))[0] for datatexti in datatexts]
+    counts = {}
+    for namei in names:
+        counts[namei] = counts.get(namei, 0) + 1
+    return [namei if counts[namei] == 1 else
+            f'{namei}-{hashlib.sha1(os.path.abspath(datatexti).encode()).hexdigest()[:8]}'
+            for namei, datatexti in zip(names, datatexts)]
+
+
+def plan_shards(datatext, shard):
+    '''
+    按照tcp.stream的范围划分大文件。
+    :param shard: 每个分片的TCP流数量，为0时不划分。
+    :return: TCP流编号的范围列表，不划分时为[None]。
+    '''
+    if not shard:
+        return [None]
+    # 在父进程中建立索引，避免多个子进程同时建立。
+    count = len(load_index(datatext))
+    return [range(begin, min(begin + shard, count)) for begin in range(0, count, shard)] or [None]
+
+
+def handle_task(datatext, saketext, protocol, single, backend, streams):
+    '''
+    子进程处理一个pcap文件或者其中一个分片。
+    '''
+    handle_pcap(datatext, saketext, protocol, 'w', single, backend, None if streams is None else list(streams))
+    return saketext
+
+
+def merge_sakes(saketexts, saketext):
+    '''
+    按顺序拼接多个处理文件，每个处理文件以stream_logo结尾，拼接后流的边界不变。
+    处理文件可以是压缩文件，见open_handle。
+    '''
+    with open_handle(saketext, 'w') as sake:
+        for saketexti in saketexts:
+            with open_handle(saketexti, 'r') as sakei:
+                last = ''
+                while True:
+                    block = sakei.read(handle_buffer)
+                    if not block:
+                        break
+                    sake.write(block)
+                    last = block[-1]
+                # 补充缺少的行末换行符，避免与下一个文件的首行相连。
+                if last and last != '\n':
+                    sake.write('\n')
+    return saketext
+
+
+def handle_batch(pcaps, protocol, saketext = None, workers = None, shard = 0, single = False, backend = 'pyshark',
+                 suffix = '.txt'):
+    '''
+    使用进程池处理多个pcap文件，每个子进程写入各自的处理文件。
+    :param pcaps: pcap文件名称列表或者通配符，见gather_pcaps。
+    :param protocol: 协议名称。
+    :param saketext: 合并后的处理文件名称，位于sake_cata；为None时不合并。
+    :param workers: 进程数量，默认为CPU数量。
+    :param shard: 大文件中每个分片的TCP流数量，为0时不划分，见plan_shards。
+    :param single: 见handle_pcap。
+    :param backend: 见handle_pcap。
+    :param suffix: 处理文件的扩展名，如'.txt.gz'，见open_handle。
+    :return: 各个处理文件的完整路径，按照pcap文件和分片的顺序排列。
+    '''
+    tasks = []
+    datatexts = gather_pcaps(pcaps)
+    for datatext, name in zip(datatexts, plan_names(datatexts)):
+        shards = plan_shards(datatext, shard)
+        for j, streams in enumerate(shards):
+            part = name if len(shards) == 1 else f'{name}-{j}'
+            tasks.append((datatext, f'{sake_cata}{part}{suffix}', protocol, single, backend, streams))
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(handle_task, *taski) for taski in tasks]
+        saketexts = [futurei.result() for futurei in futures]
+    if saketext is not None:
+        merge_sakes(saketexts, f'{sake_cata}{saketext}{suffix}')
+    return saketexts
+
+
+if __name__ == '__main__':
+    handle_batch('ftp-lbnl-annon-*', 'ftp', 'ftp-lbnl-annon')
@@ -0,0 +1,106 @@
+'''
+处理协议报文包的公共部分：TCP流的处理状态、报文对的整理以及处理文件的写入。
+'''
+from os_manager import split_logo, stream_logo, loss_logo
+
+
+class StreamFlow:
+    '''
+    TCP流的处理状态，逐流读取和单次遍历两种方式共用。
+    '''
+
+    def __init__(self, number):
+        # TCP流编号。
+        self.number = number
+        # 该TCP流中是否含有报文，不能直接使用len()判断 -> 0 packets。
+        self.flag = False
+        # 该TCP流是否提前结束，之后的报文不再处理。
+        self.finish = False
+        # 一对请求输入报文。
+        self.messpairs = []
+        # 上一个报文是否是输入报文，约定状态机的输入报文对应请求报文。
+        self.old_give = False
+        # 客户端视角的请求端口、响应端口。
+        self.oldprsrc, self.oldprdst = None, None
+        # 该TCP流写入处理文件的各行。
+        self.lines = []
+
+
+def order_flows(flows):
+    '''
+    按TCP流编号的顺序产出分桶后的TCP流，最后产出一个不含报文的TCP流。
+    :type flows: dict[int, StreamFlow]。
+    '''
+    # tcp.stream是连续编号的。
+    stream_number = 0
+    while stream_number in flows:
+        yield flows.pop(stream_number)
+        stream_number += 1
+    yield StreamFlow(stream_number)
+
+
+def pair_messages(flow, result, give):
+    '''
+    按照请求、响应报文对整理报文，缺少的一方使用loss_logo补充。
+    :param give: 是否是请求报文。
+    :return: 写入的报文对，没有写入时返回空列表。
+    '''
+    messpairs = []
+    if give:
+        # 如果此时messpairs存在内容，说明上一对缺少响应报文。
+        if flow.messpairs:
+            flow.messpairs.append(loss_logo)
+            messpairs = flow.messpairs
+            flow.lines.extend(messpairs)
+        flow.messpairs = [result]
+    else:
+        if not flow.messpairs:
+            flow.messpairs.append(loss_logo)
+        flow.messpairs.append(result)
+        messpairs = flow.messpairs
+        flow.lines.extend(messpairs)
+        flow.messpairs = []
+    return messpairs
+
+
+def write_flow(sake, flow):
+    '''
+    将TCP流的各行写入处理文件，并增加流之间的分割行。
+    '''
+    if flow.lines:
+        sake.write('\n'.join(flow.lines) + '\n')
+    sake.write(stream_logo + '\n')
+
+
+def give_messages(flow, result, give):
+    '''
+    按照报文到达的顺序整理报文，连续两个同类报文之间使用loss_logo补充。
+    :param give: 是否是输入报文。
+    '''
+    # 如果返回的give标志与上一次的give标志相同的话，表示两次连续的报文时相同的，中间缺少另一种报文。
+    if give is flow.old_give:
+        flow.lines.append(loss_logo)
+    flow.old_give = give
+    flow.lines.append(result.replace('\n', ' '))
+
+
+def build_letters(letters):
+    '''
+    分析文本协议的一段报文载荷，主要字段为命令或响应码，次要字段按照'\\r\\n'分割。
+    :param letters: 解码后的报文载荷。
+    :return: 当前报文段解读结果。
+    '''
+    # 如果前3个字符是数字，则提取。
+    if letters[:3].isdigit():
+        space_splits = [letters[:3], letters[3:].lstrip('\r\n ')]
+    # 否则先按照' '分割字符串1次。
+    else:
+        space_splits = letters.split(' ', 1)
+    result = space_splits[0].rstrip('\r\n').upper() + ':'
+    # TODO: 是否需要处理content。
+    # 然后按照'\r\n'分割次要字段。
+    if len(space_splits) > 1:
+        minors = space_splits[1].split('\r\n')
+        result += split_logo.join([minori for minori in minors if minori])
+    return result
+
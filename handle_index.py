@@ -0,0 +1,205 @@
+'''
+pcap文件的TCP流索引，以二进制格式保存在pcap文件旁边，用于直接读取某些TCP流的报文而不扫描整个文件。
+索引文件依次为文件头、非报文块、各TCP流、各TCP流的报文范围以及各报文的偏移和长度，除文件头外都是numpy数组，读取时使用内存映射。
+'''
+import os
+from array import array
+from struct import Struct
+from socket import inet_ntop, AF_INET, AF_INET6
+import numpy
+from handle_native import map_records, locate_tcp, pcapng_shb, tcp_fin, tcp_syn, tcp_rst, tcp_head
+
+# 索引文件的后缀。
+index_suffix = '.index'
+# 索引文件头：标志、pcap文件的大小、修改时间（纳秒）、是否是pcapng、非报文块数量、TCP流数量、报文数量。
+index_head = Struct('<8sqqB7xqqq')
+index_magic = b'ESPTIDX1'
+# 各TCP流的两个端点以及首末时间戳，IP地址以16字节存放，family为4或者16。
+stream_dtype = numpy.dtype([
+    ('ipsrc', 'S16'), ('sport', '<u2'), ('ipdst', 'S16'), ('dport', '<u2'), ('family', 'u1'),
+    ('first', '<f8'), ('last', '<f8')
+])
+# 本进程已经读取的索引：pcap文件的完整路径 -> StreamIndex，pcap文件改变时重新读取。
+indexes: dict[str, 'StreamIndex'] = {}
+
+
+class StreamIndex:
+    '''
+    一个pcap文件的TCP流索引。bounds[i]:bounds[i + 1]是第i个TCP流的报文在offsets、lengths中的范围，按照在文件中的顺序排列。
+    '''
+
+    def __init__(self, size, mtime, pcapng, heads, streams, bounds, offsets, lengths):
+        # pcap文件的大小、修改时间（纳秒），用于判断索引是否过期。
+        self.size, self.mtime = size, mtime
+        self.pcapng = pcapng
+        # pcapng文件中的SHB、IDB等非报文块的(偏移, 长度)；pcap文件只有24字节的文件头。
+        self.heads: numpy.ndarray = heads
+        self.streams: numpy.ndarray = streams
+        self.bounds: numpy.ndarray = bounds
+        self.offsets: numpy.ndarray = offsets
+        self.lengths: numpy.ndarray = lengths
+
+    def __len__(self):
+        return len(self.streams)
+
+    def look_key(self, number):
+        '''
+        获取TCP流的(IP, 端口, IP, 端口)。
+        '''
+        streami = self.streams[number]
+        family = AF_INET if streami['family'] == 4 else AF_INET6
+        return [inet_ntop(family, bytes(streami['ipsrc']).ljust(streami['family'], b'\0')), int(streami['sport']),
+                inet_ntop(family, bytes(streami['ipdst']).ljust(streami['family'], b'\0')), int(streami['dport'])]
+
+    def look_spans(self, numbers):
+        '''
+        获取若干TCP流的全部报文的(偏移, 长度)，按照在文件中的顺序排列。
+        :param numbers: TCP流编号。
+        :rtype: list[tuple[int, int]]。
+        '''
+        bounds = self.bounds
+        chosen = [numpy.arange(bounds[numberi], bounds[numberi + 1]) for numberi in numbers]
+        chosen = numpy.concatenate(chosen) if chosen else numpy.zeros(0, numpy.int64)
+        chosen = chosen[numpy.argsort(self.offsets[chosen], kind = 'stable')]
+        return list(zip(self.offsets[chosen].tolist(), self.lengths[chosen].tolist()))
+
+    def write_index(self, road):
+        '''
+        写入索引文件，先写入临时文件再改名。
+        '''
+        with open(road + '.part', 'wb') as indextext:
+            indextext.write(index_head.pack(
+                index_magic, self.size, self.mtime, self.pcapng, len(self.heads), len(self.streams), len(self.offsets)
+            ))
+            for arrayi in (self.heads, self.streams, self.bounds, self.offsets, self.lengths):
+                indextext.write(arrayi.tobytes())
+        os.replace(road + '.part', road)
+
+    @classmethod
+    def read_index(cls, road, status):
+        '''
+        读取索引文件，文件头与pcap文件的大小、修改时间不符时返回None。
+        :rtype: StreamIndex | None。
+        '''
+        with open(road, 'rb') as indextext:
+            head = indextext.read(index_head.size)
+        if len(head) < index_head.size:
+            return None
+        magic, size, mtime, pcapng, headl, streaml, packetl = index_head.unpack(head)
+        if magic != index_magic or (size, mtime) != (status.st_size, status.st_mtime_ns):
+            return None
+        arrays, offset = [], index_head.size
+        for dtype, shape in ((numpy.dtype('<i8'), (headl, 2)), (stream_dtype, (streaml,)),
+                             (numpy.dtype('<i8'), (streaml + 1,)), (numpy.dtype('<i8'), (packetl,)),
+                             (numpy.dtype('<i8'), (packetl,))):
+            count = int(numpy.prod(shape))
+            arrays.append(numpy.memmap(road, dtype, 'r', offset, shape) if count else numpy.zeros(shape, dtype))
+            offset += count * dtype.itemsize
+        return cls(size, mtime, bool(pcapng), *arrays)
+
+
+def index_road(datatext):
+    '''
+    索引文件的完整路径，与pcap文件位于同一目录，如info/pcap/。
+    '''
+    return datatext + index_suffix
+
+
+def build_index(datatext):
+    '''
+    扫描一次pcap文件，建立TCP流编号到5元组、报文位置以及首末时间戳的索引，并写入索引文件。
+    TCP流按照第一次出现的顺序编号；端口被重用时，流结束（FIN、RST）之后的SYN开始新的TCP流，与tshark的tcp.stream一致。
+    :return: 索引。
+    :rtype: StreamIndex。
+    '''
+    status = os.stat(datatext)
+    heads = []
+    streams = []
+    # 各报文的TCP流编号、偏移以及长度。
+    numbers, offsets, lengths = array('q'), array('q'), array('q')
+    # 两个端点按顺序排列的键到TCP流编号的映射。
+    keys: dict[tuple, int] = {}
+    # 已经结束的TCP流编号。
+    finishes = set()
+    for linktype, timestamp, span, packet in map_records(datatext, heads = heads):
+        located = locate_tcp(linktype, packet)
+        if not located:
+            continue
+        ipsrc, ipdst, begin, end = located
+        sport, dport, seq, ack, dataofs, flags = tcp_head.unpack_from(packet, begin)[:6]
+        key = tuple(sorted([(bytes(ipsrc), sport), (bytes(ipdst), dport)]))
+        number = keys.get(key)
+        if number is None or (number in finishes and flags & tcp_syn and not flags & 0x10):
+            number = keys[key] = len(streams)
+            streams.append([bytes(ipsrc), sport, bytes(ipdst), dport, len(ipsrc), timestamp, timestamp])
+        streams[number][6] = timestamp
+        numbers.append(number)
+        offsets.append(span[0])
+        lengths.append(span[1])
+        if flags & (tcp_fin | tcp_rst):
+            finishes.add(number)
+    with open(datatext, 'rb') as data:
+        pcapng = data.read(4) == pcapng_shb
+    # 报文按照TCP流分组，组内保持在文件中的顺序。
+    numbers = numpy.frombuffer(numbers, numpy.int64) if numbers else numpy.zeros(0, numpy.int64)
+    order = numpy.argsort(numbers, kind = 'stable')
+    bounds = numpy.zeros(len(streams) + 1, numpy.int64)
+    numpy.cumsum(numpy.bincount(numbers, minlength = len(streams)), out = bounds[1:])
+    index = StreamIndex(
+        status.st_size, status.st_mtime_ns, pcapng,
+        numpy.array(heads if pcapng else [(0, 24)], numpy.int64).reshape(-1, 2),
+        numpy.array([tuple(streami) for streami in streams], stream_dtype),
+        bounds,
+        numpy.frombuffer(offsets, numpy.int64)[order] if offsets else numpy.zeros(0, numpy.int64),
+        numpy.frombuffer(lengths, numpy.int64)[order] if lengths else numpy.zeros(0, numpy.int64)
+    )
+    index.write_index(index_road(datatext))
+    indexes[os.path.abspath(datatext)] = index
+    return index
+
+
+def load_index(datatext):
+    '''
+    获取pcap文件的索引：本进程已经读取过时直接使用，否则读取索引文件；索引不存在或者pcap文件已经改变时重新建立。
+    :rtype: StreamIndex。
+    '''
+    road = os.path.abspath(datatext)
+    status = os.stat(datatext)
+    index = indexes.get(road)
+    if index and (index.size, index.mtime) == (status.st_size, status.st_mtime_ns):
+        return index
+    try:
+        index = StreamIndex.read_index(index_road(datatext), status)
+    except (OSError, ValueError):
+        index = None
+    if index is None:
+        return build_index(datatext)
+    indexes[road] = index
+    return index
+
+
+def map_streams(datatext, numbers):
+    '''
+    只读取若干TCP流的报文，产出格式与map_records相同。
+    :param numbers: TCP流编号。
+    '''
+    index = load_index(datatext)
+    begins = [spani[0] for spani in index.look_spans(numbers)]
+    if index.pcapng:
+        begins = sorted(begins + index.heads[:, 0].tolist())
+    yield from map_records(datatext, begins)
+
+
+def extract_streams(datatext, numbers, subtext):
+    '''
+    将若干TCP流的报文写入新的pcap文件，供只能读取完整文件的tshark使用。新文件中的TCP流从0开始重新编号。
+    :param numbers: TCP流编号。
+    :param subtext: 新的pcap文件名称。
+    '''
+    index = load_index(datatext)
+    spans = sorted([tuple(headi) for headi in index.heads.tolist()] + index.look_spans(numbers))
+    with open(datatext, 'rb') as data, open(subtext, 'wb') as sub:
+        for begin, length in spans:
+            data.seek(begin)
+            sub.write(data.read(length))
+    return subtext
@@ -0,0 +1,563 @@
+'''
+不依赖tshark，直接解析pcap、pcapng文件并重组TCP流，处理文本协议报文包。
+'''
+import sys
+import time
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from file_manager import open_handle
+from handle_common import StreamFlow, pair_messages, write_flow, build_letters
+from os_manager import sake_cata, pcap_cata
+
+# 各文本协议的服务器端口。
+# live555（RTSP）的请求以方法、响应以状态码为主要字段，见handle_pyshark.step_live555，build_letters不能得到相同的结果，
+# 因此暂不支持，使用handle_pyshark处理。
+server_ports = {
+    'ftp': 21,
+    'smtp': 25,
+    'pop': 110,
+    'lightftp': 9999
+}
+# 链路层类型：以太网、原始IP、Linux cooked、Linux cooked v2、BSD loopback。
+link_ethernet, link_raw, link_sll, link_sll2, link_null = 1, 101, 113, 276, 0
+link_raws = {link_raw, 12, 14, 228, 229}
+# pcap、pcapng文件的格式。
+pcap_heads = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9)
+}
+pcapng_shb = b'\x0a\x0d\x0d\x0a'
+# TCP标志位。
+tcp_fin, tcp_syn, tcp_rst = 0x01, 0x02, 0x04
+# 序号空间。
+seq_space = 1 << 32
+
+ipv4_head = Struct('!BxHHHBBH4s4s')
+ipv6_head = Struct('!4xHBB16s16s')
+tcp_head = Struct('!HHIIBBHHH')
+# scapy中TCP标志位的字符表示，从低位到高位。
+tcp_letters = 'FSRPAUECN'
+
+
+def read_records(datatext):
+    '''
+    读取pcap或pcapng文件的报文记录。
+    :param datatext: 数据报文pcap、pcapng文件名称。
+    :return: (链路层类型, 时间戳, 报文数据)生成器。
+    '''
+    with open(datatext, 'rb') as data:
+        yield from scan_records(data, datatext)
+
+
+def scan_records(data, datatext = ''):
+    '''
+    从文件对象中顺序读取报文记录，不使用seek，因此也适用于管道。
+    :param data: 二进制文件对象，只需要实现read方法。
+    :return: 见read_records。
+    '''
+    magic = data.read(4)
+    if magic == pcapng_shb:
+        yield from read_pcapng(data, magic)
+        return
+    if magic not in pcap_heads:
+        raise ValueError(f'{datatext} is neither a pcap nor a pcapng file.')
+    order, tsresol = pcap_heads[magic]
+    linktype = Struct(f'{order}I').unpack(data.read(20)[16:20])[0]
+    record_head = Struct(f'{order}IIII')
+    while True:
+        head = data.read(16)
+        if len(head) < 16:
+            return
+        ts_sec, ts_frac, caplen, length = record_head.unpack(head)
+        packet = data.read(caplen)
+        # 文件在记录中间结束。
+        if len(packet) < caplen:
+            return
+        yield linktype, ts_sec + ts_frac * tsresol, packet
+
+
+def read_pcapng(data, prefix = b''):
+    '''
+    读取pcapng文件的报文记录，支持EPB、SPB以及旧的PB块。
+    :param prefix: 已经从data中读出的文件开头。
+    '''
+    # 各接口的链路层类型、时间戳精度、截断长度。
+    faces = []
+    order = '<'
+    while True:
+        head, prefix = prefix + data.read(8 - len(prefix)), b''
+        if len(head) < 8:
+            return
+        if head[:4] == pcapng_shb:
+            # Section Header Block由字节序标志确定之后所有块的字节序。
+            magic = data.read(4)
+            order = '<' if magic == b'\x4d\x3c\x2b\x1a' else '>'
+            length = Struct(f'{order}I').unpack(head[4:])[0]
+            data.read(length - 12)
+            faces = []
+            continue
+        kind, length = Struct(f'{order}II').unpack(head)
+        body = data.read(length - 8)
+        if len(body) < length - 8:
+            return
+        if kind == 1:
+            # Interface Description Block。
+            linktype, snaplen = Struct(f'{order}H2xI').unpack_from(body)
+            faces.append([linktype, option_tsresol(body, 8, length - 12, order), snaplen])
+        elif kind == 6:
+            # Enhanced Packet Block。
+            face, ts_high, ts_low, caplen = Struct(f'{order}IIII').unpack_from(body)
+            linktype, tsresol, snaplen = faces[face]
+            yield linktype, ((ts_high << 32) | ts_low) * tsresol, body[20:20 + caplen]
+        elif kind == 3:
+            # Simple Packet Block，只属于0号接口且没有时间戳。
+            linktype, tsresol, snaplen = faces[0]
+            caplen = min(Struct(f'{order}I').unpack_from(body)[0], length - 16)
+            if snaplen:
+                caplen = min(caplen, snaplen)
+            yield linktype, 0.0, body[4:4 + caplen]
+        elif kind == 2:
+            # 已经废弃的Packet Block。
+            face, ts_high, ts_low, caplen = Struct(f'{order}H2xIII').unpack_from(body)
+            linktype, tsresol, snaplen = faces[face]
+            yield linktype, ((ts_high << 32) | ts_low) * tsresol, body[20:20 + caplen]
+
+
+def option_tsresol(body, begin, end, order):
+    '''
+    读取Interface Description Block中的if_tsresol选项，默认精度为微秒。
+    '''
+    option = Struct(f'{order}HH')
+    while begin + 4 <= end:
+        code, length = option.unpack_from(body, begin)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = body[begin + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        begin += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+class FollowFile:
+    '''
+    跟踪仍在写入的文件：读到文件末尾时等待新的数据，而不是结束。
+    '''
+
+    def __init__(self, raw, interval = 0.5, idle = None, finish = None, wait = time.sleep):
+        # 二进制文件对象。
+        self.raw = raw
+        # 轮询文件增长的间隔，单位为秒。
+        self.interval = interval
+        # 文件连续不增长的最长时间，超过后视为写入结束；None表示一直等待。
+        self.idle = idle
+        # 写入结束的信号，返回True之后读到文件末尾即停止，不再等待idle。
+        self.finish = finish
+        # 等待interval秒的函数，测试时可以替换为不依赖时钟的函数。
+        self.wait = wait
+        # 管道读到末尾即为写入结束，不需要等待。
+        self.piped = not raw.seekable()
+
+    def read(self, size):
+        chunks, rest, waited = [], size, 0.0
+        while rest > 0:
+            # 先检查结束信号再读取，信号之前写入的数据都能读到。
+            finished = self.finish is not None and self.finish()
+            chunk = self.raw.read(rest)
+            if chunk:
+                chunks.append(chunk)
+                rest -= len(chunk)
+                waited = 0.0
+                continue
+            if self.piped or finished or (self.idle is not None and waited >= self.idle):
+                break
+            self.wait(self.interval)
+            waited += self.interval
+        return b''.join(chunks)
+
+
+def follow_records(datatext, interval = 0.5, idle = None, finish = None, wait = time.sleep):
+    '''
+    读取仍在写入的pcap或pcapng文件，报文记录写入后即产出。
+    :param datatext: 数据报文pcap、pcapng文件名称，'-'表示标准输入的管道。
+    :param interval: 见FollowFile。
+    :param idle: 见FollowFile。
+    :param finish: 见FollowFile。
+    :param wait: 见FollowFile。
+    :return: 见read_records。
+    '''
+    if datatext == '-':
+        yield from scan_records(FollowFile(sys.stdin.buffer, interval, idle, finish, wait), datatext)
+        return
+    with open(datatext, 'rb') as data:
+        yield from scan_records(FollowFile(data, interval, idle, finish, wait), datatext)
+
+
+def map_records(datatext, begins = None, heads = None):
+    '''
+    使用mmap扫描pcap或pcapng文件，记录头直接在映射的缓冲区上解析，报文数据以memoryview切片产出，不发生复制。
+    内存占用与文件大小无关，由操作系统按需换入换出页面。
+    :param datatext: 数据报文pcap、pcapng文件名称。
+    :param begins: 只读取这些偏移处的记录，需要按偏移排列；pcapng文件还需要包含其之前的SHB、IDB块。默认读取全部记录。
+    :param heads: 用于收集pcapng文件中非报文块的(偏移, 长度)的列表。
+    :return: (链路层类型, 时间戳, 记录的(偏移, 长度), 报文数据memoryview)生成器。
+    '''
+    with open(datatext, 'rb') as data:
+        mapped = mmap(data.fileno(), 0, access = ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        if view[:4] == pcapng_shb:
+            yield from map_pcapng(view, begins, heads)
+            return
+        magic = bytes(view[:4])
+        if magic not in pcap_heads:
+            raise ValueError(f'{datatext} is neither a pcap nor a pcapng file.')
+        order, tsresol = pcap_heads[magic]
+        linktype = Struct(f'{order}I').unpack_from(view, 20)[0]
+        record_head = Struct(f'{order}IIII')
+        begin, size = 24, len(view)
+        chosen = iter(begins) if begins is not None else None
+        while True:
+            if chosen is not None:
+                begin = next(chosen, size)
+            if begin + 16 > size:
+                return
+            ts_sec, ts_frac, caplen, length = record_head.unpack_from(view, begin)
+            yield linktype, ts_sec + ts_frac * tsresol, (begin, 16 + caplen), view[begin + 16:begin + 16 + caplen]
+            begin += 16 + caplen
+    finally:
+        # 仍有报文数据的memoryview存活时无法立即关闭，交给垃圾回收。
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            pass
+
+
+def map_pcapng(view, begins = None, heads = None):
+    '''
+    在映射的缓冲区上扫描pcapng文件的报文记录，见read_pcapng、map_records。
+    '''
+    faces = []
+    order, begin, size = '<', 0, len(view)
+    chosen = iter(begins) if begins is not None else None
+    while True:
+        if chosen is not None:
+            begin = next(chosen, size)
+        if begin + 12 > size:
+            return
+        if view[begin:begin + 4] == pcapng_shb:
+            # Section Header Block由字节序标志确定之后所有块的字节序。
+            order = '<' if view[begin + 8:begin + 12] == b'\x4d\x3c\x2b\x1a' else '>'
+            faces = []
+        kind, length = Struct(f'{order}II').unpack_from(view, begin)
+        if kind == 6:
+            # Enhanced Packet Block。
+            face, ts_high, ts_low, caplen = Struct(f'{order}IIII').unpack_from(view, begin + 8)
+            linktype, tsresol, snaplen = faces[face]
+            yield linktype, ((ts_high << 32) | ts_low) * tsresol, (begin, length), view[begin + 28:begin + 28 + caplen]
+        elif kind == 3:
+            # Simple Packet Block，只属于0号接口且没有时间戳。
+            linktype, tsresol, snaplen = faces[0]
+            caplen = min(Struct(f'{order}I').unpack_from(view, begin + 8)[0], length - 16)
+            if snaplen:
+                caplen = min(caplen, snaplen)
+            yield linktype, 0.0, (begin, length), view[begin + 12:begin + 12 + caplen]
+        elif kind == 2:
+            # 已经废弃的Packet Block。
+            face, ts_high, ts_low, caplen = Struct(f'{order}H2xIII').unpack_from(view, begin + 8)
+            linktype, tsresol, snaplen = faces[face]
+            yield linktype, ((ts_high << 32) | ts_low) * tsresol, (begin, length), view[begin + 28:begin + 28 + caplen]
+        else:
+            if kind == 1:
+                # Interface Description Block。
+                linktype, snaplen = Struct(f'{order}H2xI').unpack_from(view, begin + 8)
+                faces.append([linktype, option_tsresol(view, begin + 16, begin + length - 4, order), snaplen])
+            if heads is not None:
+                heads.append((begin, length))
+        begin += length
+
+
+def locate_tcp(linktype, packet):
+    '''
+    定位报文中的TCP首部。
+    :return: (源IP, 目的IP, TCP首部偏移, IP载荷结束偏移)，非TCP报文返回None。
+    '''
+    if linktype == link_ethernet:
+        begin, ethertype = 14, int.from_bytes(packet[12:14], 'big')
+        # 802.1Q、802.1ad的VLAN标签。
+        while ethertype in (0x8100, 0x88a8) and len(packet) >= begin + 4:
+            ethertype, begin = int.from_bytes(packet[begin + 2:begin + 4], 'big'), begin + 4
+    elif linktype == link_sll:
+        begin, ethertype = 16, int.from_bytes(packet[14:16], 'big')
+    elif linktype == link_sll2:
+        begin, ethertype = 20, int.from_bytes(packet[0:2], 'big')
+    elif linktype == link_null:
+        family = int.from_bytes(packet[0:4], 'little') or int.from_bytes(packet[0:4], 'big')
+        begin, ethertype = 4, 0x0800 if family == 2 else 0x86dd
+    elif linktype in link_raws:
+        begin, ethertype = 0, 0x0800 if packet[0] >> 4 == 4 else 0x86dd
+    else:
+        return None
+    if ethertype == 0x0800:
+        if len(packet) < begin + 20:
+            return None
+        verihl, total, ident, fragment, ttl, proto, checksum, ipsrc, ipdst = ipv4_head.unpack_from(packet, begin)
+        # 只处理TCP协议，不处理IP分片。
+        if proto != 6 or fragment & 0x1fff:
+            return None
+        end = begin + total if total else len(packet)
+        begin += (verihl & 0x0f) * 4
+    elif ethertype == 0x86dd:
+        if len(packet) < begin + 40:
+            return None
+        length, proto, hop, ipsrc, ipdst = ipv6_head.unpack_from(packet, begin)
+        end = begin + 40 + length if length else len(packet)
+        begin += 40
+        # 跳过逐跳选项、路由、目的选项扩展首部。
+        while proto in (0, 43, 60) and len(packet) >= begin + 8:
+            proto, begin = packet[begin], begin + (packet[begin + 1] + 1) * 8
+        if proto != 6:
+            return None
+    else:
+        return None
+    if len(packet) < begin + 20:
+        return None
+    return ipsrc, ipdst, begin, end
+
+
+def decode_packet(linktype, packet):
+    '''
+    解析报文的IP、TCP首部。
+    :return: (源IP, 源端口, 目的IP, 目的端口, 序号, 标志位, 载荷)，非TCP报文返回None。
+    '''
+    located = locate_tcp(linktype, packet)
+    if not located:
+        return None
+    ipsrc, ipdst, begin, end = located
+    sport, dport, seq, ack, dataofs, flags, window, chksum, urgptr = tcp_head.unpack_from(packet, begin)
+    return ipsrc, sport, ipdst, dport, seq, flags, packet[begin + (dataofs >> 4) * 4:end]
+
+
+def decode_tcp(packet, begin):
+    '''
+    直接在缓冲区上解析TCP首部的各字段，与scapy的TCP字段相同。
+    :param begin: TCP首部偏移，见locate_tcp。
+    :return: 标志位的字符表示，(sport, dport, seq, ack, dataofs, reserved, window, chksum, urgptr)。
+    '''
+    sport, dport, seq, ack, dataofs, flags, window, chksum, urgptr = tcp_head.unpack_from(packet, begin)
+    # 9位标志位中的最高位NS位于dataofs字节的最低位。
+    flags |= (dataofs & 0x01) << 8
+    letters = ''.join([tcp_letters[i] for i in range(9) if flags >> i & 1])
+    return letters, (sport, dport, seq, ack, dataofs >> 4, (dataofs >> 1) & 0x07, window, chksum, urgptr)
+
+
+class TcpHalf:
+    '''
+    TCP连接一个方向上的字节流重组。
+    '''
+
+    def __init__(self):
+        # 下一个期望的序号，None表示还没有确定。
+        self.nxtseq = None
+        # 乱序到达的报文段，按序号存放。
+        self.pending: dict[int, bytes] = {}
+        # 已经按序重组但还没有按'\r\n'切分的载荷。
+        self.buffer = bytearray()
+        # 是否已经收到FIN。
+        self.fin = False
+
+    def offset(self, seq):
+        '''
+        序号相对于nxtseq的偏移，考虑序号回绕。
+        '''
+        diff = (seq - self.nxtseq) % seq_space
+        return diff - seq_space if diff >= seq_space >> 1 else diff
+
+    def feed(self, seq, flags, payload):
+        '''
+        添加一个报文段。
+        :return: 是否有新的按序载荷。
+        '''
+        if flags & tcp_syn:
+            self.nxtseq = (seq + 1) % seq_space
+            seq = self.nxtseq
+        elif self.nxtseq is None:
+            # 抓包开始时连接已经建立。
+            self.nxtseq = seq
+        if flags & tcp_fin:
+            self.fin = True
+        if not payload:
+            return False
+        offset = self.offset(seq)
+        if offset > 0:
+            # 乱序的报文段等待前面的数据到达，保留较长的重传。
+            if len(payload) > len(self.pending.get(seq, b'')):
+                self.pending[seq] = bytes(payload)
+            return False
+        # 重传的报文段只保留新的部分。
+        if len(payload) + offset <= 0:
+            return False
+        self.buffer += payload[-offset:] if offset else payload
+        self.nxtseq = (self.nxtseq + len(payload) + offset) % seq_space
+        while self.pending:
+            fresh = False
+            for seqi in list(self.pending):
+                offseti = self.offset(seqi)
+                if offseti > 0:
+                    continue
+                payloadi = self.pending.pop(seqi)
+                if len(payloadi) + offseti > 0:
+                    self.buffer += payloadi[-offseti:] if offseti else payloadi
+                    self.nxtseq = (self.nxtseq + len(payloadi) + offseti) % seq_space
+                    fresh = True
+            if not fresh:
+                break
+        return True
+
+    def split(self, finish = False):
+        '''
+        按'\r\n'切分出完整的报文载荷，切分点为最后一个'\r\n'。
+        :param finish: 是否取出全部剩余载荷。
+        :rtype: bytes。
+        '''
+        end = len(self.buffer) if finish else self.buffer.rfind(b'\r\n') + 2
+        if end <= 0:
+            return b''
+        payload = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return payload
+
+
+class NativeFlow(StreamFlow):
+    '''
+    以5元组区分的TCP连接，客户端、服务器两个方向分别重组。
+    '''
+
+    def __init__(self, number, key):
+        super().__init__(number)
+        # (客户端IP, 客户端端口, 服务器IP, 服务器端口)。
+        self.key = key
+        # 客户端发向服务器、服务器发向客户端的字节流。
+        self.client, self.server = TcpHalf(), TcpHalf()
+        # 上一次收到载荷的方向。
+        self.last: TcpHalf | None = None
+
+    def emit(self, half, finish = False):
+        '''
+        将一个方向上完整的报文载荷交给报文对整理。
+        '''
+        payload = half.split(finish)
+        if payload:
+            pair_messages(self, build_letters(payload.decode('utf-8', 'replace')), half is self.client)
+
+    def feed(self, half, seq, flags, payload):
+        # 对方开始发送数据时，说明上一方向的报文已经结束。
+        other = self.server if half is self.client else self.client
+        if payload and self.last is other:
+            self.emit(other, True)
+        if half.feed(seq, flags, payload):
+            self.last = half
+            self.emit(half)
+        if flags & tcp_rst or (self.client.fin and self.server.fin):
+            self.close()
+
+    def close(self):
+        if self.finish:
+            return
+        for halfi in (self.client, self.server) if self.last is self.client else (self.server, self.client):
+            self.emit(halfi, True)
+        self.finish = True
+
+
+def read_flows(datatext, protocol, records = None, ordered = True, timeout = None):
+    '''
+    读取数据报文，重组服务器端口上的TCP连接。
+    :param protocol: 协议名称，见server_ports。
+    :param records: 报文记录，格式与read_records相同，如follow_records；默认使用map_records扫描datatext。
+    :param ordered: 是否按照连接出现的顺序产出；为False时连接结束后立即产出，适用于跟踪仍在写入的文件。
+    :param timeout: 连接的空闲超时时间，单位为秒，超时的连接视为结束；None表示不超时。
+    :return: 处理完毕的NativeFlow生成器，最后产出一个不含报文的TCP流。
+    '''
+    if protocol not in server_ports:
+        raise ValueError(f'Protocol {protocol} not supported.')
+    server_port = server_ports[protocol]
+    if records is None:
+        records = ((linktype, timestamp, packet) for linktype, timestamp, span, packet in map_records(datatext))
+    # 以(客户端IP, 客户端端口, 服务器IP, 服务器端口)为键的连接，已经产出的连接置为None。
+    flows: dict[tuple, NativeFlow | None] = {}
+    # 按照编号排列、等待写入的连接。
+    numbers: dict[int, NativeFlow] = {}
+    # 各连接最后一个报文的时间戳。
+    stamps: dict[int, float] = {}
+    stream_number, fresh_number, sweep = 0, 0, None
+    for linktype, timestamp, packet in records:
+        fields = decode_packet(linktype, packet)
+        if not fields:
+            continue
+        ipsrc, sport, ipdst, dport, seq, flags, payload = fields
+        if dport == server_port:
+            key, give = (ipsrc, sport, ipdst, dport), True
+        elif sport == server_port:
+            key, give = (ipdst, dport, ipsrc, sport), False
+        else:
+            continue
+        flow = flows.get(key)
+        if not flow or flow.finish:
+            # 连接结束之后，只有再次出现的SYN才开始新的连接。
+            if key in flows and not flags & tcp_syn:
+                continue
+            flow = flows[key] = numbers[fresh_number] = NativeFlow(fresh_number, key)
+            fresh_number += 1
+        flow.flag = True
+        flow.feed(flow.client if give else flow.server, seq, flags, payload)
+        stamps[flow.number] = timestamp
+        finishes = [flow] if flow.finish else []
+        # 每秒检查一次空闲超时的连接。
+        if timeout is not None and (sweep is None or timestamp - sweep >= 1):
+            sweep = timestamp
+            for numberi, stampi in stamps.items():
+                if timestamp - stampi > timeout and not numbers[numberi].finish:
+                    numbers[numberi].close()
+                    finishes.append(numbers[numberi])
+        if not ordered:
+            for finished in finishes:
+                del numbers[finished.number], stamps[finished.number]
+                if flows[finished.key] is finished:
+                    flows[finished.key] = None
+                yield finished
+            continue
+        # 依次产出已经结束的连接，保持编号顺序。
+        while stream_number in numbers and numbers[stream_number].finish:
+            finished = numbers.pop(stream_number)
+            del stamps[stream_number]
+            if flows[finished.key] is finished:
+                flows[finished.key] = None
+            yield finished
+            stream_number += 1
+    for numberi in sorted(numbers):
+        flow = numbers.pop(numberi)
+        flow.close()
+        yield flow
+    yield StreamFlow(fresh_number)
+
+
+def handle_native(datatext, saketext, protocol, textflag = 'w'):
+    '''
+    分析数据报文并写入文件，格式与handle_lightftp相同。
+    :param datatext: 数据报文pcap、pcapng文件名称。
+    :param saketext: 写入目标文件名称。
+    :param protocol: 协议名称。
+    :param textflag: 文件的写方式。
+    '''
+    with open_handle(saketext, textflag) as sake:
+        for flow in read_flows(datatext, protocol):
+            write_flow(sake, flow)
+
+
+def main(pcaptext, saketext, protocol, textflag = 'w'):
+    handle_native(f'{pcap_cata}{pcaptext}', f'{sake_cata}{saketext}.txt', protocol, textflag)
+
+
+if __name__ == '__main__':
+    main('light-ftp.pcap', 'light-ftp', 'lightftp', 'w')
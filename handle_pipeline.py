@@ -0,0 +1,146 @@
+'''
+流水线方式：分析数据报文、解析报文对以及构建状态机并发进行，不经过中间的处理文件。
+'''
+from queue import Queue
+from threading import Thread
+from os_manager import sake_cata, pcap_cata
+from file_manager import open_handle
+from handle_common import write_flow
+from handle_native import read_flows, follow_records
+from daikon.textpro import build_flow_messages
+from automata.common import Transducer
+from automata.sptia import Esptia
+
+# 队列结束的标志。
+queue_end = object()
+
+
+class PipeError:
+    '''
+    上游线程的异常，经过队列传递给下游线程。
+    '''
+
+    def __init__(self, error):
+        self.error = error
+
+
+def pump(source, sink):
+    '''
+    在线程中将生成器的产出依次放入有界队列，队列满时阻塞，最后放入queue_end。
+    :type sink: Queue。
+    '''
+    try:
+        for itemi in source:
+            sink.put(itemi)
+    except BaseException as error:
+        sink.put(PipeError(error))
+    finally:
+        sink.put(queue_end)
+
+
+def drain(source):
+    '''
+    依次取出队列中的元素，直到queue_end；上游线程的异常在此处重新抛出。
+    :type source: Queue。
+    '''
+    while True:
+        itemi = source.get()
+        if itemi is queue_end:
+            return
+        if isinstance(itemi, PipeError):
+            raise itemi.error
+        yield itemi
+
+
+def flow_messages(flows, saketext = None, textflag = 'w', flush = False):
+    '''
+    由TCP流直接构建报文序列，不经过处理文件的各行；结果与build_message_seqs读取handle_native写入的文件相同。
+    :param flows: StreamFlow生成器，见read_flows。
+    :param saketext: 同时写入的处理文件，为None时不写入。
+    :param flush: 是否每个TCP流写入后立即刷新缓冲区，跟踪仍在写入的文件时使用。
+    :return: list[Message]生成器，不含报文的TCP流被跳过。
+    '''
+    sake = open_handle(saketext, textflag) if saketext else None
+    try:
+        for flow in flows:
+            if sake:
+                write_flow(sake, flow)
+                if flush:
+                    sake.flush()
+            arrays = build_flow_messages(flow.lines)
+            if arrays:
+                yield arrays
+    finally:
+        if sake:
+            sake.close()
+
+
+def pipe_flows(flows, saketext = None, textflag = 'w', size = 64, flush = False):
+    '''
+    在线程中分析数据报文、构建报文序列，通过有界队列交给调用者线程；下游处理较慢时队列已满，上游线程阻塞。
+    :param flows: StreamFlow生成器，见read_flows。
+    :param size: 队列的容量。
+    :param flush: 见flow_messages。
+    :return: list[Message]生成器。
+    '''
+    arrays = Queue(size)
+    thread = Thread(target = pump, args = (flow_messages(flows, saketext, textflag, flush), arrays), daemon = True)
+    thread.start()
+    yield from drain(arrays)
+    thread.join()
+
+
+def pipe_message_seqs(datatext, protocol, saketext = None, textflag = 'w', size = 64):
+    '''
+    流水线方式读取数据报文，调用者线程取出的报文序列与build_message_seqs的结果相同。
+    :return: list[Message]生成器。
+    '''
+    return pipe_flows(read_flows(datatext, protocol), saketext, textflag, size)
+
+
+def follow_message_seqs(datatext, protocol, interval = 0.5, idle = None, timeout = 60, saketext = None,
+                        textflag = 'w', size = 64, finish = None):
+    '''
+    跟踪仍在写入的pcap、pcapng文件或者管道，TCP连接结束（或者空闲超时）后立即产出其报文序列。
+    :param datatext: 数据报文文件名称，'-'表示标准输入。
+    :param interval: 轮询文件增长的间隔，见FollowFile。
+    :param idle: 文件连续不增长的最长时间，超过后结束；None表示一直跟踪。
+    :param timeout: 连接的空闲超时时间，见read_flows。
+    :param finish: 写入结束的信号，见FollowFile。
+    :return: list[Message]生成器。
+    '''
+    records = follow_records(datatext, interval, idle, finish)
+    return pipe_flows(read_flows(datatext, protocol, records, False, timeout), saketext, textflag, size, True)
+
+
+def pipe_transducer(datatext, protocol, transducer: Transducer, level = 2, limit = 4, saketext = None,
+                    textflag = 'w', size = 64, follow = False, idle = None):
+    '''
+    流水线方式构建前缀树：TCP流结束后立即成为报文序列并加入状态机。
+    :param transducer: 状态机，Esptia按照limit分批化简，其他状态机只构建前缀树。
+    :param level: 见Esptia.build_esptia。
+    :param limit: 见Esptia.build_esptia。
+    :param saketext: 同时写入的处理文件，为None时不写入。
+    :param follow: 是否跟踪仍在写入的文件，见follow_message_seqs。
+    :param idle: 见follow_message_seqs。
+    :return: 状态机。
+    '''
+    if follow:
+        arrays = follow_message_seqs(datatext, protocol, idle = idle, saketext = saketext, textflag = textflag,
+                                     size = size)
+    else:
+        arrays = pipe_message_seqs(datatext, protocol, saketext, textflag, size)
+    if isinstance(transducer, Esptia):
+        transducer.build_esptia(arrays, level, limit)
+    else:
+        transducer.build_pretree(arrays)
+    return transducer
+
+
+def main(pcaptext, protocol, level = 2, limit = 4, saketext = None, textflag = 'w'):
+    return pipe_transducer(f'{pcap_cata}{pcaptext}', protocol, Esptia(protocol), level, limit,
+                           f'{sake_cata}{saketext}.txt' if saketext else None, textflag)
+
+
+if __name__ == '__main__':
+    main('light-ftp.pcap', 'lightftp', 2, 4, 'light-ftp')
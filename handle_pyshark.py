@@ -1,50 +1,82 @@
 '''
 利用pyshark库处理协议报文包。
 '''
+import os
+import subprocess
+import tempfile
 from pyshark import FileCapture
 from pyshark.packet.layers.xml_layer import XmlLayer
-from os_manager import split_logo, stream_logo, loss_logo, sake_cata, pcap_cata
+from os_manager import split_logo, stream_logo, loss_logo, content_logo, sake_cata, pcap_cata, tshark_road
+from file_manager import open_handle
+from handle_common import StreamFlow, order_flows, pair_messages, give_messages, write_flow, build_letters
+from handle_index import extract_streams
 
 
-def handle_tcp(datatext, saketext, protocol, textflag='w'):
+def gather_flows(datatext, step, single = False):
+    '''
+    按TCP流编号的顺序产出处理完毕的TCP流。
+    :param datatext: 数据报文pcap文件名称。
+    :param step: 处理单个报文的函数，形如step(flow, capi)。
+    :param single: 是否只解析一次pcap文件并按tcp.stream分桶；默认为False，即每个TCP流重新解析一次pcap文件。
+    :return: StreamFlow生成器，最后产出一个不含报文的TCP流。
+    '''
+    if not single:
+        stream_number = 0
+        while True:
+            flow = StreamFlow(stream_number)
+            with FileCapture(datatext, keep_packets = False, display_filter = f'tcp.stream eq {stream_number}') as caps:
+                for capi in caps:
+                    flow.flag = True
+                    step(flow, capi)
+                    if flow.finish:
+                        break
+            yield flow
+            if not flow.flag:
+                return
+            stream_number += 1
+    # 单次遍历：tshark只解析一次pcap文件，报文按照tcp.stream放入各自的TCP流中。
+    flows: dict[int, StreamFlow] = {}
+    with FileCapture(datatext, keep_packets = False) as caps:
+        for capi in caps:
+            if 'tcp' not in capi:
+                continue
+            stream_number = int(capi.tcp.stream)
+            flow = flows.get(stream_number)
+            if not flow:
+                flow = flows[stream_number] = StreamFlow(stream_number)
+            flow.flag = True
+            if not flow.finish:
+                step(flow, capi)
+    yield from order_flows(flows)
+
+
+def step_tcp(flow, pkti):
+    if len(pkti) < 3:
+        return
+    tcppkt = pkti[2]
+    tcplogos = ['srcport', 'dstport', 'len', 'seq', 'nxtseq', 'ack', 'hdr_len', 'window_size_value',
+                'checksum']
+    tcpminors = [tcppkt.get_field_value(tcplogoi) for tcplogoi in tcplogos]
+    if not flow.oldprdst or not flow.oldprsrc:
+        flow.oldprsrc, flow.oldprdst = tcpminors[1], tcpminors[0]
+    # 标志选取flags还是flags_str？
+    result = tcppkt.get_field_value('flags') + ':' + split_logo.join(tcpminors)
+    # 请求报文。
+    if (flow.oldprsrc, flow.oldprdst) == (tcpminors[0], tcpminors[1]):
+        pair_messages(flow, result, True)
+    elif (flow.oldprsrc, flow.oldprdst) == (tcpminors[1], tcpminors[0]):
+        pair_messages(flow, result, False)
+
+
+def handle_tcp(datatext, saketext, protocol, textflag='w', single=False):
     if protocol != 'tcp':
         raise ValueError('Only TCP protocol is supported.')
-    stream_number = 0
     # 假定第一条是响应报文，即第一个报文对缺少请求报文。
-    with open(saketext, textflag) as sake:
-        while True:
-            # 客户端视角的请求端口、响应端口。
-            oldprsrc, oldprdst = None, None
-            with FileCapture(datatext, keep_packets=False, display_filter=f'tcp.stream eq {stream_number}') as pkts:
-                # 一对请求输入报文。
-                messpairs = []
-                for pkti in pkts:
-                    if len(pkti) < 3:
-                        continue
-                    tcppkt = pkti[2]
-                    tcplogos = ['srcport', 'dstport', 'len', 'seq', 'nxtseq', 'ack', 'hdr_len', 'window_size_value',
-                                'checksum']
-                    tcpminors = [tcppkt.get_field_value(tcplogoi) for tcplogoi in tcplogos]
-                    if not oldprdst or not oldprsrc:
-                        oldprsrc, oldprdst = tcpminors[1], tcpminors[0]
-                    # 标志选取flags还是flags_str？
-                    result = tcppkt.get_field_value('flags') + ':' + split_logo.join(tcpminors)
-                    # 请求报文。
-                    if (oldprsrc, oldprdst) == (tcpminors[0], tcpminors[1]):
-                        if messpairs:
-                            messpairs.append(loss_logo)
-                            sake.write('\n'.join(messpairs) + '\n')
-                        messpairs = [result]
-                    elif (oldprsrc, oldprdst) == (tcpminors[1], tcpminors[0]):
-                        if not messpairs:
-                            messpairs.append(loss_logo)
-                        messpairs.append(result)
-                        sake.write('\n'.join(messpairs) + '\n')
-                        messpairs = []
-            if not oldprdst or not oldprsrc:
+    with open_handle(saketext, textflag) as sake:
+        for flow in gather_flows(datatext, step_tcp, single):
+            if not flow.oldprdst or not flow.oldprsrc:
                 break
-            stream_number += 1
-            sake.write(stream_logo + '\n')
+            write_flow(sake, flow)
 
 
 def handle_ftp(ftp_pkt):
@@ -125,9 +157,7 @@ def handle_pop(pop_pkt):
     return result, give
 
 
-def handle_lightftp(datatext, saketext, protocol, textflag = 'w'):
-    if protocol != 'lightftp':
-        raise ValueError('Only LightFTP protocol is supported.')
+def step_lightftp(flow, capi):
     # 服务器端口。
     server_port = '9999'
     # 协议的主要字段。
@@ -135,129 +165,105 @@ def handle_lightftp(datatext, saketext, protocol, textflag = 'w'):
     #     'CWD', 'EPSV', 'ERPT', 'FEAT', 'LIST', 'MKD', 'NLST', 'PASV', 'PASS', 'PORT', 'QUIT',
     #     'RETR', 'SIZE', 'STOR', 'SYST', 'TYPE', 'USER'
     # ]
-    with open(saketext, textflag) as sake:
-        stream_number = 0
-        flag = True
-        while flag:
-            with FileCapture(datatext, keep_packets = False, display_filter = f'tcp.stream eq {stream_number}') as caps:
-                # 一对输入、输出报文。
-                messpairs = []
-                flag = False
-                for capi in caps:
-                    flag = True
-                    if len(capi.layers) < 4:
-                        continue
-                    tcppkt_srcport, tcppkt_dstport = capi[2].srcport, capi[2].dstport
-                    if server_port not in (tcppkt_srcport, tcppkt_dstport):
-                        if len(messpairs) == 1:
-                            messpairs.append(loss_logo)
-                        if len(messpairs) == 2:
-                            sake.write('\n'.join(messpairs) + '\n')
-                        sake.write(stream_logo + '\n')
-                        break
-                    if capi[3].layer_name != 'DATA':
-                        continue
-                    lightftppkt = bytes.fromhex(capi[3].data)
-                    lftp_letters = lightftppkt.decode('utf-8')
-                    # 如果前3个字符是数字，则提取。
-                    if lftp_letters[:3].isdigit():
-                        space_splits = [lftp_letters[:3], lftp_letters[3:].lstrip('\r\n ')]
-                    # 否则先按照' '分割字符串1次。
-                    else:
-                        space_splits = lftp_letters.split(' ', 1)
-                    result = space_splits[0].rstrip('\r\n').upper() + ':'
-                    # TODO: 是否需要处理content。
-                    # 然后按照'\r\n'分割次要字段。
-                    if len(space_splits) > 1:
-                        minors = space_splits[1].split('\r\n')
-                        result += split_logo.join([minori for minori in minors if minori])
-                    # 服务器发过来的响应报文。
-                    if tcppkt_srcport == server_port:
-                        if not messpairs:
-                            messpairs.append(loss_logo)
-                        messpairs.append(result)
-                        sake.write('\n'.join(messpairs) + '\n')
-                        messpairs = []
-                    # 客户端发向服务器的请求报文。
-                    elif tcppkt_dstport == server_port:
-                        # 如果此时messpairs存在内容，说明上一对缺少响应报文。
-                        if messpairs:
-                            messpairs.append(loss_logo)
-                            sake.write('\n'.join(messpairs) + '\n')
-                        messpairs = [result]
-            stream_number += 1
-            sake.write(stream_logo + '\n')
+    if len(capi.layers) < 4:
+        return
+    tcppkt_srcport, tcppkt_dstport = capi[2].srcport, capi[2].dstport
+    if server_port not in (tcppkt_srcport, tcppkt_dstport):
+        if len(flow.messpairs) == 1:
+            flow.messpairs.append(loss_logo)
+        if len(flow.messpairs) == 2:
+            flow.lines.extend(flow.messpairs)
+        flow.lines.append(stream_logo)
+        flow.finish = True
+        return
+    if capi[3].layer_name != 'DATA':
+        return
+    result = build_letters(bytes.fromhex(capi[3].data).decode('utf-8'))
+    # 服务器发过来的响应报文。
+    if tcppkt_srcport == server_port:
+        pair_messages(flow, result, False)
+    # 客户端发向服务器的请求报文。
+    elif tcppkt_dstport == server_port:
+        pair_messages(flow, result, True)
 
 
-def handle_live555(datatext, saketext, protocol, textflag = 'w'):
-    if protocol != 'live555':
-        raise ValueError('Only RTSP-Live555 protocol is supported.')
+def handle_lightftp(datatext, saketext, protocol, textflag = 'w', single = False):
+    if protocol != 'lightftp':
+        raise ValueError('Only LightFTP protocol is supported.')
+    with open_handle(saketext, textflag) as sake:
+        for flow in gather_flows(datatext, step_lightftp, single):
+            write_flow(sake, flow)
+
+
+def step_live555(flow, capi):
     # 服务器端口。
     server_port = '8554'
-    with open(saketext, textflag) as sake:
-        stream_number = 0
-        # 协议的主要字段。
-        flag = True
-        while flag:
-            with FileCapture(datatext, keep_packets = False, display_filter = f'tcp.stream eq {stream_number}') as caps:
-                # 一对输入、输出报文。
-                messpairs = []
-                flag = False
-                for capi in caps:
-                    flag = True
-                    if len(capi.layers) < 4:
-                        continue
-                    # 源端口、目的端口。
-                    srcport, dstport = str(capi[2].srcport), str(capi[2].dstport)
-                    if server_port not in (srcport, dstport):
-                        continue
-                    rtsppkt: None | XmlLayer = None
-                    if capi[3].layer_name == 'rtsp':
-                        rtsppkt = capi[3]
-                    elif len(capi.layers) > 4 and capi[4].layer_name == 'rtsp':
-                        rtsppkt = capi[4]
-                    # TODO: 存在部分字段无法获取。
-                    logos = rtsppkt.field_names
-                    if 'request' in logos:
-                        if messpairs:
-                            messpairs.append(loss_logo)
-                            sake.write('\n'.join(messpairs) + '\n')
-                            print(messpairs)
-                        result = rtsppkt.get_field_value('method')
-                        if not result:
-                            result = loss_logo
-                        else:
-                            result += ':' + split_logo.join([
-                                str(rtsppkt.get_field_value(logoi)).rstrip('\\r\\n\r\n')
-                                for logoi in logos if logoi not in ('method', 'request')
-                            ])
-                        messpairs = [result]
-                    elif 'response' in logos:
-                        if not messpairs:
-                            messpairs.append(loss_logo)
-                        result = rtsppkt.get_field_value('status')
-                        if not result:
-                            result = loss_logo
-                        else:
-                            result += ':' + split_logo.join([
-                                str(rtsppkt.get_field_value(logoi)).rstrip('\\r\\n\r\n')
-                                for logoi in logos if logoi not in ('status', 'response')
-                            ])
-                        messpairs.append(result)
-                        sake.write('\n'.join(messpairs) + '\n')
-                        print(messpairs)
-                        messpairs = []
-            stream_number += 1
-            sake.write(stream_logo + '\n')
+    if len(capi.layers) < 4:
+        return
+    # 源端口、目的端口。
+    srcport, dstport = str(capi[2].srcport), str(capi[2].dstport)
+    if server_port not in (srcport, dstport):
+        return
+    rtsppkt: None | XmlLayer = None
+    if capi[3].layer_name == 'rtsp':
+        rtsppkt = capi[3]
+    elif len(capi.layers) > 4 and capi[4].layer_name == 'rtsp':
+        rtsppkt = capi[4]
+    # TODO: 存在部分字段无法获取。
+    logos = rtsppkt.field_names
+    if 'request' in logos:
+        result = rtsppkt.get_field_value('method')
+        if not result:
+            result = loss_logo
+        else:
+            result += ':' + split_logo.join([
+                str(rtsppkt.get_field_value(logoi)).rstrip('\\r\\n\r\n')
+                for logoi in logos if logoi not in ('method', 'request')
+            ])
+        messpairs = pair_messages(flow, result, True)
+        if messpairs:
+            print(messpairs)
+    elif 'response' in logos:
+        result = rtsppkt.get_field_value('status')
+        if not result:
+            result = loss_logo
+        else:
+            result += ':' + split_logo.join([
+                str(rtsppkt.get_field_value(logoi)).rstrip('\\r\\n\r\n')
+                for logoi in logos if logoi not in ('status', 'response')
+            ])
+        print(pair_messages(flow, result, False))
 
 
-def handle(data_text, sake_text, protocol, text_flag = 'w'):
+def handle_live555(datatext, saketext, protocol, textflag = 'w', single = False):
+    if protocol != 'live555':
+        raise ValueError('Only RTSP-Live555 protocol is supported.')
+    with open_handle(saketext, textflag) as sake:
+        for flow in gather_flows(datatext, step_live555, single):
+            write_flow(sake, flow)
+
+
+def step_data(flow, capi, protocol, pro_handle):
+    # 从数据链路层开始算。
+    if len(capi.layers) < 4:
+        return
+    # 分析最高层的报文（pyshark/packet/layers/xml_layer.py/XmlLayer）。
+    data_pkt = capi[3]
+    # 只有POP协议会将无field_names的报文视作载荷报文。
+    if data_pkt.layer_name != protocol or (protocol != 'pop' and not data_pkt.field_names):
+        return
+    result, give = pro_handle(data_pkt)
+    give_messages(flow, result, give)
+
+
+def handle(data_text, sake_text, protocol, text_flag = 'w', single = False):
     '''
     分析数据报文并写入文件。
     :param data_text: 数据报文pcap文件名称。
     :param sake_text: 写入目标文件名称。
     :param protocol: 协议名称。
     :param text_flag: 文件的写方式。
+    :param single: 是否只解析一次pcap文件，见gather_flows。
     '''
     # 协议处理函数。
     pro_catalog = {
@@ -267,56 +273,175 @@ def handle(data_text, sake_text, protocol, text_flag = 'w'):
     }
     if protocol not in pro_catalog:
         raise ValueError(f'Protocol {protocol} not supported.')
-    with open(sake_text, text_flag) as sake:
-        # TCP流编号。
-        stream_number = 0
-        # 该TCP流中是否含有报文，不能直接使用len()判断 -> 0 packets；默认含有。
-        flag = True
-        while flag:
-            # 只有进入内部的循环才会再次置为True。
-            # 初始化输入报文标志为False，约定状态机的输入报文对应请求报文。
-            flag, old_give = False, False
-            with FileCapture(data_text, keep_packets = False,
-                             display_filter = f'tcp.stream eq {stream_number}') as caps:
-                for capi in caps:
-                    flag = True
-                    # 从数据链路层开始算。
-                    if len(capi.layers) < 4:
-                        continue
-                    # 分析最高层的报文（pyshark/packet/layers/xml_layer.py/XmlLayer）。
-                    data_pkt = capi[3]
-                    # 只有POP协议会将无field_names的报文视作载荷报文。
-                    if data_pkt.layer_name != protocol or (protocol != 'pop' and not data_pkt.field_names):
-                        continue
-                    result, give = pro_catalog[protocol](data_pkt)
-                    # 如果返回的give标志与上一次的give标志相同的话，表示两次连续的报文时相同的，中间缺少另一种报文。
-                    if give is old_give:
-                        sake.write(loss_logo + '\n')
-                    old_give = give
-                    # 写入.txt文件。
-                    sake.write(result.replace('\n', ' ') + '\n')
+    with open_handle(sake_text, text_flag) as sake:
+        for flow in gather_flows(
+                data_text, lambda flow, capi: step_data(flow, capi, protocol, pro_catalog[protocol]), single
+        ):
             # 如果报文流结束时，old_give = True，说明上一个报文是请求报文，缺少响应报文。
-            if old_give:
-                sake.write(loss_logo + '\n')
+            if flow.old_give:
+                flow.lines.append(loss_logo)
             # 应该直接写入txt文件或再考虑其他文件。
             # 先根据主要的标识符确定好基本的SPT，在SPT的基础上，根据每两个相邻状态q1, q2获取报文序列的子集，
             # 确定值之间的关系，此时应该使用到csv文件。
-            stream_number += 1
-            # 增加流之间的分割行。
-            sake.write(stream_logo + '\n')
-            print(f'Stream {stream_number - 1} has finished!')
+            write_flow(sake, flow)
+            print(f'Stream {flow.number} has finished!')
+
 
+class FieldValue(str):
+    '''
+    tshark字段模式下的字段值，等同于第一次出现的值，与LayerFieldsContainer相同。
+    '''
+
+    def __new__(cls, value):
+        # 多次出现的字段由fields_aggregator连接。
+        occurs = value.split(fields_aggregator)
+        field = super().__new__(cls, occurs[0])
+        field.occurs = occurs
+        return field
+
+    @property
+    def all_fields(self):
+        return [FieldValue(occuri) for occuri in self.occurs]
+
+    @property
+    def showname_value(self):
+        return str(self)
+
+
+class FieldsLayer:
+    '''
+    tshark字段模式下一个报文的协议层，提供与XmlLayer相同的field_names、get_field_value接口，
+    因此可以直接交给handle_ftp、handle_smtp、handle_pop分析。
+    '''
+
+    def __init__(self, layer_name, logos, values):
+        self.layer_name = layer_name
+        # 只保留报文中存在的字段，字段顺序与fields_catalog中一致。
+        self.catalog = {logoi: FieldValue(valuei) for logoi, valuei in zip(logos, values) if valuei}
+        self.field_names = list(self.catalog)
+
+    def get_field_value(self, logo):
+        return self.catalog.get(logo)
 
-def main(pcaptext, saketext, protocol, text_flag = 'w'):
-    if protocol == 'tcp':
-        handle_tcp(f'{pcap_cata}{pcaptext}', f'{sake_cata}{saketext}.txt', protocol, text_flag)
-    elif protocol == 'lightftp':
-        handle_lightftp(f'{pcap_cata}{pcaptext}', f'{sake_cata}{saketext}.txt', protocol, text_flag)
-    elif protocol == 'live555':
-        handle_live555(f'{pcap_cata}{pcaptext}', f'{sake_cata}{saketext}.txt', protocol, text_flag)
-    else:
-        handle(f'{pcap_cata}{pcaptext}', f'{sake_cata}{saketext}.txt', protocol, text_flag)
 
+# tshark字段模式中多次出现的字段的连接符。
+fields_aggregator = '\x1f'
+# frame.protocols中不对应pyshark协议层的项，如eth:ethertype:ip中的ethertype。
+fields_hidden = {'ethertype'}
+# tshark字段模式下各协议提取的字段，表示请求、响应的布尔字段在前，对应field_names[0]的判断。
+fields_catalog = {
+    'ftp': ['ftp.request', 'ftp.response', 'ftp.request.command', 'ftp.request.arg', 'ftp.response.code',
+            'ftp.response.arg'],
+    'smtp': ['smtp.req', 'smtp.rsp', 'smtp.req.command', 'smtp.req.parameter', 'smtp.response.code',
+             'smtp.rsp.parameter'],
+    'pop': ['pop.request', 'pop.response', 'pop.request.command', 'pop.request.parameter',
+            'pop.response.indicator', 'pop.response.description']
+}
+
+
+def gather_fields(data_text, protocol, pro_handle):
+    '''
+    只运行一个字段模式（-T fields）的tshark进程，流式解析其输出，按TCP流编号的顺序产出处理完毕的TCP流。
+    :param pro_handle: 协议处理函数，即handle_ftp、handle_smtp、handle_pop。
+    :return: StreamFlow生成器，最后产出一个不含报文的TCP流。
+    '''
+    # 与pyshark的字段名称相同：去除协议前缀，'.'替换为'_'。
+    logos = [fieldi.split('.', 1)[1].replace('.', '_') for fieldi in fields_catalog[protocol]]
+    command = [
+        tshark_road, '-r', data_text, '-T', 'fields', '-E', 'header=n', '-E', 'separator=/t',
+        '-E', 'occurrence=a', '-E', f'aggregator={fields_aggregator}', '-e', 'tcp.stream', '-e', 'frame.protocols'
+    ]
+    for fieldi in fields_catalog[protocol]:
+        command += ['-e', fieldi]
+    flows: dict[int, StreamFlow] = {}
+    with subprocess.Popen(command, stdout = subprocess.PIPE, text = True, encoding = 'utf-8',
+                          errors = 'replace') as tshark:
+        for linei in tshark.stdout:
+            columns = linei.rstrip('\n').split('\t')
+            if not columns[0]:
+                continue
+            stream_number = int(columns[0].split(fields_aggregator)[0])
+            flow = flows.get(stream_number)
+            if not flow:
+                flow = flows[stream_number] = StreamFlow(stream_number)
+            flow.flag = True
+            # frame.protocols形如eth:ethertype:ip:tcp:ftp，去除fields_hidden之后的第4层即pyshark中的capi[3]，
+            # 与step_data相同；VLAN、TLS等使得capi[3]不是协议层时同样跳过。
+            layers = [layeri for layeri in columns[1].split(':') if layeri not in fields_hidden]
+            if len(layers) < 4 or layers[3] != protocol:
+                continue
+            data_pkt = FieldsLayer(layers[3], logos, columns[2:])
+            # pyshark的协议层含有该层的全部字段，只是没有提取的字段时仍然是载荷报文，与step_data相同，交给pro_handle得到content。
+            if not data_pkt.field_names:
+                data_pkt.field_names = [content_logo]
+            result, give = pro_handle(data_pkt)
+            give_messages(flow, result, give)
+    if tshark.returncode:
+        raise subprocess.CalledProcessError(tshark.returncode, command)
+    yield from order_flows(flows)
+
+
+def handle_fields(data_text, sake_text, protocol, text_flag = 'w'):
+    '''
+    使用tshark字段模式分析数据报文并写入文件，结果与handle相同。
+    :param data_text: 数据报文pcap文件名称。
+    :param sake_text: 写入目标文件名称。
+    :param protocol: 协议名称。
+    :param text_flag: 文件的写方式。
+    '''
+    # 协议处理函数。
+    pro_catalog = {
+        'ftp': handle_ftp,
+        'smtp': handle_smtp,
+        'pop': handle_pop
+    }
+    if protocol not in pro_catalog:
+        raise ValueError(f'Protocol {protocol} not supported.')
+    with open_handle(sake_text, text_flag) as sake:
+        for flow in gather_fields(data_text, protocol, pro_catalog[protocol]):
+            # 如果报文流结束时，old_give = True，说明上一个报文是请求报文，缺少响应报文。
+            if flow.old_give:
+                flow.lines.append(loss_logo)
+            write_flow(sake, flow)
+            print(f'Stream {flow.number} has finished!')
+
+
+def handle_pcap(data_text, sake_text, protocol, text_flag = 'w', single = False, backend = 'pyshark', streams = None):
+    '''
+    按照协议选择处理方式，分析数据报文并写入文件。
+    :param data_text: 数据报文pcap、pcapng文件名称。
+    :param sake_text: 写入目标文件名称。
+    :param single: 是否只解析一次pcap文件，适用于含有大量TCP流的pcap文件。
+    :param backend: 分析FTP、SMTP、POP协议的方式，'pyshark'使用pyshark的协议层对象，'fields'使用tshark字段模式。
+    :param streams: 只分析的TCP流编号，见handle_index；通过索引将这些TCP流的报文提取到临时的pcap文件，tshark不再扫描整个文件。
+    '''
+    if backend not in ('pyshark', 'fields'):
+        raise ValueError(f'Backend {backend} not supported.')
+    if streams is not None:
+        sub_fd, sub_text = tempfile.mkstemp(suffix = os.path.splitext(data_text)[1], dir = os.path.dirname(data_text))
+        os.close(sub_fd)
+        data_text = extract_streams(data_text, streams, sub_text)
+    try:
+        if backend == 'fields':
+            handle_fields(data_text, sake_text, protocol, text_flag)
+        elif protocol == 'tcp':
+            handle_tcp(data_text, sake_text, protocol, text_flag, single)
+        elif protocol == 'lightftp':
+            handle_lightftp(data_text, sake_text, protocol, text_flag, single)
+        elif protocol == 'live555':
+            handle_live555(data_text, sake_text, protocol, text_flag, single)
+        else:
+            handle(data_text, sake_text, protocol, text_flag, single)
+    finally:
+        if streams is not None:
+            os.remove(data_text)
+
+
+def main(pcaptext, saketext, protocol, text_flag = 'w', single = False, backend = 'pyshark', streams = None):
+    '''
+    见handle_pcap。
+    '''
+    handle_pcap(f'{pcap_cata}{pcaptext}', f'{sake_cata}{saketext}.txt', protocol, text_flag, single, backend, streams)
 
 if __name__ == '__main__':
     main('live555-rtsp.pcapng', 'live555-rtsp', 'live555', 'w')
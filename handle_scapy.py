@@ -1,44 +1,143 @@
+from collections import OrderedDict
 from scapy.layers.inet import TCP
 from scapy.utils import PcapReader
 from os_manager import split_logo, stream_logo, loss_logo, sake_cata, pcap_cata
+from file_manager import open_handle
+from handle_native import map_records, locate_tcp, decode_tcp
+from handle_index import map_streams
 
 
-def handle_tcp(datatext, saketext, protocol, textflag='w'):
+def gather_tcp(datatext, mapped = False, streams = None):
+    '''
+    读取数据报文中IPv4的TCP报文。
+    :param mapped: 是否使用mmap扫描pcap文件并直接解析首部，不构建scapy报文对象；默认为False，即使用PcapReader。
+    :param streams: 只读取的TCP流编号，见handle_index；不为None时通过索引直接定位报文，总是使用mmap。
+    :return: (时间戳, IP源地址, 源端口, IP目的地址, 目的端口, TCP标志位, 当前报文段解读结果)生成器。
+    '''
+    tcpfields = ['sport', 'dport', 'seq', 'ack', 'dataofs', 'reserved', 'window', 'chksum', 'urgptr']
+    if mapped or streams is not None:
+        records = map_records(datatext) if streams is None else map_streams(datatext, streams)
+        for linktype, timestamp, span, packet in records:
+            located = locate_tcp(linktype, packet)
+            # 与scapy的'IP'层相同，只处理IPv4。
+            if not located or len(located[0]) != 4:
+                continue
+            letters, tcpminors = decode_tcp(packet, located[2])
+            yield timestamp, located[0], tcpminors[0], located[1], tcpminors[1], packet[located[2] + 13], \
+                letters + ':' + split_logo.join([str(tcpminori) for tcpminori in tcpminors])
+        return
+    with PcapReader(datatext) as scapkts:
+        for scapkti in scapkts:
+            if 'IP' not in scapkti or 'TCP' not in scapkti:
+                continue
+            ippkt, tcppkt = scapkti['IP'], scapkti['TCP']
+            result = str(tcppkt.flags) + ':' + split_logo.join([
+                str(getattr(tcppkt, tcpfieldi)) for tcpfieldi in tcpfields
+            ])
+            yield float(scapkti.time), ippkt.src, tcppkt.sport, ippkt.dst, tcppkt.dport, int(tcppkt.flags), result
+
+
+def handle_tcp(datatext, saketext, protocol, textflag='w', mapped=False, streams=None):
     if protocol != 'tcp':
         raise Exception('protocol is not tcp')
     i = 0
-    with open(saketext, textflag) as sake:
-        with PcapReader(datatext) as scapkts:
-            ipsrc, ipdst, prsrc, prdst = None, None, None, None
-            # 是否是请求报文。
-            beforeflag = True
-            for scapkti in scapkts:
-                if 'IP' not in scapkti or 'TCP' not in scapkti:
-                    continue
-                ippkt, tcppkt = scapkti['IP'], scapkti['TCP']
-                # 通过IP源地址、目的地址；TCP源端口、目的端口来辨别TCP流。
-                # 要求pcap表示的通信是顺序的。
-                if (ipsrc, ipdst) != (ippkt.src, ippkt.dst):
-                    # 如果TCP流变化，则将当前的流信息写入文件。
-                    if ipsrc:
-                        sake.write(stream_logo + '\n')
-                    ipsrc, ipdst, prsrc, prdst = ippkt.src, ippkt.dst, str(tcppkt.sport), str(tcppkt.dport)
-                    i += 1
-                    if i == 2:
-                        exit(0)
-                tcpfields = ['sport', 'dport', 'seq', 'ack', 'dataofs', 'reserved', 'window', 'chksum', 'urgptr']
-                result = str(tcppkt.flags) + ':' + split_logo.join([
-                    str(getattr(tcppkt, tcpfieldi)) for tcpfieldi in tcpfields
-                ])
-                if beforeflag:
-                    beforeflag = False
+    with open_handle(saketext, textflag) as sake:
+        ipsrc, ipdst = None, None
+        # 是否是请求报文。
+        beforeflag = True
+        for timestamp, ippkt_src, sport, ippkt_dst, dport, flags, result in gather_tcp(datatext, mapped, streams):
+            # 通过IP源地址、目的地址；TCP源端口、目的端口来辨别TCP流。
+            # 要求pcap表示的通信是顺序的。
+            if (ipsrc, ipdst) != (ippkt_src, ippkt_dst):
+                # 如果TCP流变化，则将当前的流信息写入文件。
+                if ipsrc:
+                    sake.write(stream_logo + '\n')
+                ipsrc, ipdst = ippkt_src, ippkt_dst
+                i += 1
+                if i == 2:
+                    exit(0)
+            if beforeflag:
+                beforeflag = False
+            else:
+                sake.write(result + '\n')
+                beforeflag = True
+
+
+class TcpFlow:
+    '''
+    流表中的一条TCP流，以5元组区分。
+    '''
+
+    def __init__(self, key, timestamp):
+        # 两个端点按顺序排列的5元组。
+        self.key = key
+        # 是否是请求报文。
+        self.beforeflag = True
+        # 该TCP流写入处理文件的各行。
+        self.lines = []
+        # 最后一个报文的时间戳。
+        self.last = timestamp
+        # 发送过FIN的端点。
+        self.fins = set()
+        # 是否已经结束，结束的流只保留到超时，用于忽略其后续的ACK等报文。
+        self.finish = False
+
+
+def handle_flows(datatext, saketext, protocol, textflag = 'w', mapped = False, timeout = 300, streams = None):
+    '''
+    使用流表分析交织的TCP流，不要求pcap表示的通信是顺序的。
+    每个TCP流在收到RST、双方的FIN或者超时后作为一个以stream_logo分割的块写入文件，内存只与活跃的TCP流有关。
+    :param mapped: 是否使用mmap扫描pcap文件，见gather_tcp。
+    :param timeout: TCP流的空闲超时时间，单位为秒。
+    :param streams: 只分析的TCP流编号，见gather_tcp。
+    '''
+    if protocol != 'tcp':
+        raise Exception('protocol is not tcp')
+
+    def finish_flow(flow):
+        if flow.finish:
+            return
+        flow.finish = True
+        if flow.lines:
+            sake.write('\n'.join(flow.lines) + '\n' + stream_logo + '\n')
+        flow.lines = []
+
+    # 按照最后一个报文的时间排列的流表。
+    flows: OrderedDict[tuple, TcpFlow] = OrderedDict()
+    with open_handle(saketext, textflag) as sake:
+        for timestamp, ipsrc, sport, ipdst, dport, flags, result in gather_tcp(datatext, mapped, streams):
+            # 两个方向的报文属于同一个TCP流。
+            key = tuple(sorted([(ipsrc, sport), (ipdst, dport)]))
+            flow = flows.get(key)
+            # 结束之后再次出现SYN，说明端口被重用，是新的TCP流。
+            if not flow or (flow.finish and flags & 0x02):
+                flow = flows[key] = TcpFlow(key, timestamp)
+            flow.last = timestamp
+            flows.move_to_end(key)
+            if not flow.finish:
+                if flow.beforeflag:
+                    flow.beforeflag = False
                 else:
-                    sake.write(result + '\n')
-                    beforeflag = True
+                    flow.lines.append(result)
+                    flow.beforeflag = True
+                if flags & 0x01:
+                    flow.fins.add((ipsrc, sport))
+                # 收到RST或者双方都发送了FIN。
+                if flags & 0x04 or len(flow.fins) == 2:
+                    finish_flow(flow)
+            # 淘汰超时的TCP流。
+            while flows:
+                idle = next(iter(flows.values()))
+                if timestamp - idle.last <= timeout:
+                    break
+                finish_flow(idle)
+                flows.popitem(last = False)
+        for flow in flows.values():
+            finish_flow(flow)
 
 
-def main(pcaptext, saketext, protocol, textflag='w'):
-    handle_tcp(f'{pcap_cata}{pcaptext}.pcap', f'{sake_cata}{saketext}.txt', protocol, textflag)
+def main(pcaptext, saketext, protocol, textflag='w', mapped=False, streams=None):
+    handle_tcp(f'{pcap_cata}{pcaptext}.pcap', f'{sake_cata}{saketext}.txt', protocol, textflag, mapped, streams)
 
 
 if __name__ == '__main__':
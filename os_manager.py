@@ -17,6 +17,16 @@ pcap_cata = project_path + 'info/pcap/'
 svg_cata = project_path +'info/picsvg/'
 # 测试文件生成目录。
 check_cata = project_path +'info/test/'
+# tshark可执行文件，字段模式（-T fields）的处理方式直接调用。
+tshark_road = 'tshark'
+# 解析结果缓存目录。
+cache_cata = project_path + 'info/cache/'
+# 解析结果缓存目录的大小上限，单位为字节。
+cache_limit = 1 << 30
+# 次要字段溢出到磁盘时的临时目录，None表示使用tempfile的默认目录。
+spill_cata = None
+# 溢出模式下每个转移在内存中缓冲的次要字段行数。
+spill_limit = 1 << 12
 
 # WS Daikon库的相关配置。
 # 在.perl文件中新增：
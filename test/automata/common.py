@@ -1,6 +1,7 @@
 import time
+from unittest import TestCase
 from sklearn.model_selection import KFold
-from daikon.textpro import Message, build_message_seqs
+from daikon.textpro import Message, MessageSeqs, fold_message_seqs
 from automata.common import Transducer
 
 
@@ -74,17 +75,142 @@ class TransducerTestWithoutMessage:
         result = Transducer('game')
         result.build_pretree([seqi1, seqi2, seqi3])
         result.slim_pretree(1)
+        result.tell_compatible()
         result.learn_probabilities()
         result.tell_transducer()
 
 
+def build_login_seqs():
+    # 主要字段序列相同、次要字段不同的流，以及含有折叠报文对的流。
+    seqi1 = [
+        Message.build_mespair('I1', ['name', 'player'], 'O1', ['OK++']),
+        Message.build_mespair('I3', ['name: Ll321'], chr(955), [])
+    ]
+    seqi2 = [
+        Message.build_mespair('I1', ['name', 'manager'], 'O1', ['ALLOW+']),
+        Message.build_mespair('I4', ['player: name'], '04', ['PWD'])
+    ]
+    seqi3 = [
+        Message.build_mespair('I1', ['name', 'guest'], 'O1', ['OK+']),
+        Message.build_mespair('I3', ['name: Kk987'], chr(955), [])
+    ]
+    seqi4 = [
+        Message.build_mespair('I1', ['name', 'guest'], 'O1', ['OK+']),
+        Message.build_mespair('content', ['a'], chr(955), []),
+        Message.build_mespair('content', ['b'], chr(955), []),
+        Message.build_mespair('content', ['c'], chr(955), []),
+        Message.build_mespair('I7', ['FINISH'], 'O7', ['FREE'])
+    ]
+    seqi5 = [
+        Message.build_mespair('I1', ['name', 'player'], 'O1', ['OK++']),
+        Message.build_mespair('content', ['d'], chr(955), []),
+        Message.build_mespair('content', ['e'], chr(955), []),
+        Message.build_mespair('content', ['f'], chr(955), []),
+        Message.build_mespair('I7', ['QUIT'], 'O7', ['BYE'])
+    ]
+    return list(fold_message_seqs([seqi1, seqi2, seqi3, seqi4, seqi1, seqi5]))
+
+
+class UniqueTest(TestCase):
+    def assert_same_tree(self, naive, unique):
+        # 从q0开始按照(输入, 输出)同步遍历两个前缀树，状态的标志可以不同。
+        pairs, seen = [(naive.q0, unique.q0)], set()
+        while pairs:
+            statei, statej = pairs.pop()
+            if statei in seen:
+                continue
+            seen.add(statei)
+            self.assertEqual(statei.poll, statej.poll)
+            self.assertEqual(sorted(statei.after_index), sorted(statej.after_index))
+            for key, trani in statei.after_index.items():
+                tranj = statej.after_index[key]
+                self.assertEqual(trani.poll, tranj.poll)
+                self.assertEqual(trani.end is statei, tranj.end is statej)
+                # 次要字段的顺序与逐个流构建相同。
+                self.assertEqual(list(trani.minors), list(tranj.minors))
+                pairs.append((trani.end, tranj.end))
+        self.assertEqual(len(seen), len(naive.states))
+
+    def test_build_unique(self):
+        arrays = build_login_seqs()
+        naive, unique = Transducer('login'), Transducer('login')
+        naive.build_pretree(arrays)
+        unique.build_pretree(arrays, True)
+        self.assertEqual(len(naive.states), len(unique.states))
+        self.assertEqual(len(naive.transitions), len(unique.transitions))
+        self.assertEqual(sorted((trani.give, trani.reap, trani.poll) for trani in naive.transitions),
+                         sorted((trani.give, trani.reap, trani.poll) for trani in unique.transitions))
+        self.assert_same_tree(naive, unique)
+
+
+class FrozenTest(TestCase):
+    def setUp(self):
+        self.arrays = build_login_seqs()
+        self.transducer = Transducer('login')
+        self.transducer.build_pretree(self.arrays)
+        self.transducer.slim_pretree(1)
+        self.transducer.learn_probabilities()
+        self.frozen = self.transducer.freeze()
+
+    def assert_same_state(self, now, number):
+        # 同一个状态的预测与Transducer.give_poll、Transducer.reap_poll一致。
+        frozen = self.frozen
+        self.assertEqual(number, frozen.seek_state(now.logo))
+        gives = Transducer.give_poll(now)
+        predicts = frozen.predict(number)
+        self.assertEqual(sorted(predicts), sorted(gives))
+        for give, poll in gives.items():
+            self.assertAlmostEqual(predicts[give], poll / now.poll, delta = 0.01)
+            reaps = frozen.predict(number, give)
+            self.assertEqual(sorted(reaps), sorted(Transducer.reap_poll(now, give)))
+            for reap, passp in reaps.items():
+                self.assertEqual(passp, now.seek_after(give, reap).passp)
+
+    def test_walk(self):
+        transducer, frozen = self.transducer, self.frozen
+        self.assertEqual(len(frozen), len(transducer.states))
+        for arrayi in self.arrays:
+            now, number = transducer.q0, frozen.seek_state()
+            self.assertEqual(number, 0)
+            for arrayj in arrayi:
+                self.assert_same_state(now, number)
+                after, flag = Transducer.after_state(now, arrayj)
+                self.assertIsNotNone(after)
+                self.assertEqual(frozen.check(number, arrayj), (frozen.seek_state(after.logo), flag))
+                self.assertEqual(frozen.step(number, *arrayj.look_major()), frozen.seek_state(after.logo))
+                now, number = after, frozen.seek_state(after.logo)
+            self.assert_same_state(now, number)
+        # 不存在的转移与状态。
+        self.assertEqual(frozen.step(0, 'I5', '05'), -1)
+        self.assertEqual(frozen.check(0, Message.build_mespair('I5', [], '05', [])), (-1, False))
+        self.assertEqual(frozen.step(-1, 'I1', 'O1'), -1)
+        self.assertEqual(frozen.predict(-1), {})
+        self.assertEqual(frozen.seek_state(len(frozen) + 10), -1)
+        self.assertEqual(Transducer.after_state(transducer.q0, Message.build_mespair('I5', [], '05', [])),
+                         (None, False))
+
+    def test_seek_state(self):
+        for statei in self.transducer.states:
+            number = self.frozen.seek_state(statei.logo)
+            self.assertEqual(int(self.frozen.logos[number]), statei.logo)
+            self.assertEqual(int(self.frozen.state_polls[number]), statei.poll)
+
+    def test_readonly(self):
+        frozen = self.frozen
+        for arrayi in (frozen.logos, frozen.logo_numbers, frozen.state_polls, frozen.endingps, frozen.offsets,
+                       frozen.gives, frozen.reaps, frozen.ends, frozen.polls, frozen.passps, frozen.keys):
+            self.assertFalse(arrayi.flags.writeable)
+            with self.assertRaises(ValueError):
+                arrayi[0] = arrayi[0]
+
+
 class TransducerTest:
     def __init__(self, text, protocol):
         project_path = '/home/song/codess/ESPT-code/'
         self.text_road = project_path + 'info/handle/'
         self.svg_road = project_path + 'info/picsvg/'
         self.test_road = project_path + 'info/test/automata/common/'
-        self.messages = build_message_seqs(f'{self.text_road}{text}.txt')
+        self.messages = MessageSeqs(f'{self.text_road}{text}.txt', cache = True)
         self.handletext = text
         self.protocol = protocol
 
@@ -116,7 +242,7 @@ class TransducerTest:
         with open(f'{self.test_road}{check_text}.txt', 'w') as checktext:
             checktext.write(f'Text: {self.handletext}\n\n')
             for learn_arrays, check_arrays in kfold.split(range(messagel)):
-                learns, checks = [self.messages[i] for i in learn_arrays], [self.messages[i] for i in check_arrays]
+                learns, checks = self.messages.select(learn_arrays), self.messages.select(check_arrays)
                 begin_time = time.time()
                 transducer = Transducer(self.protocol)
                 transducer.build_pretree(learns)
@@ -153,8 +279,8 @@ class TransducerTest:
             checktext.write(f'Text: {self.handletext}\nLevel: {level}\n\n')
             kfold = KFold(n_splits = min(10, messagel), shuffle = False)
             for learn_arrays, check_arrays in kfold.split(range(messagel)):
-                learns = [self.messages[i] for i in learn_arrays]
-                checks = [self.messages[i] for i in check_arrays]
+                learns = self.messages.select(learn_arrays)
+                checks = self.messages.select(check_arrays)
                 start_time = time.time()
                 transducer = Transducer(self.protocol)
                 transducer.build_pretree(learns)
@@ -176,8 +302,8 @@ class TransducerTest:
         kfold = KFold(n_splits = min(10, messagel), shuffle = False)
         i = 0
         for learn_arrays, check_arrays in kfold.split(range(messagel)):
-            learns = [self.messages[i] for i in learn_arrays]
-            checks: list[list[Message]] = [self.messages[i] for i in check_arrays]
+            learns = self.messages.select(learn_arrays)
+            checks: MessageSeqs = self.messages.select(check_arrays)
             transducer = Transducer(self.protocol)
             transducer.build_pretree(learns)
             transducer.slim_pretree(level)
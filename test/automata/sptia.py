@@ -1,6 +1,6 @@
 import time
 from sklearn.model_selection import KFold
-from daikon.textpro import build_message_seqs
+from daikon.textpro import MessageSeqs
 from automata.sptia import Esptia
 from os_manager import sake_cata, svg_cata, check_cata, loss_minor, content_logo
 
@@ -8,7 +8,7 @@ from os_manager import sake_cata, svg_cata, check_cata, loss_minor, content_logo
 class EsptiaTest:
     def __init__(self, text, protocol):
         self.check_holder = f'{check_cata}automata/sptia/'
-        self.messages = build_message_seqs(f'{sake_cata}{text}.txt')
+        self.messages = MessageSeqs(f'{sake_cata}{text}.txt', cache = True)
         self.handle_text = text
         self.protocol = protocol
 
@@ -21,7 +21,7 @@ class EsptiaTest:
         with open(f'{self.check_holder}{check_text}.txt', 'w') as checktext:
             checktext.write(f'Text: {self.handle_text}\nLevel: {level}\n\n')
             for learn_arrays, check_arrays in kfold.split(range(messagel)):
-                learns, checks = [self.messages[i] for i in learn_arrays], [self.messages[i] for i in check_arrays]
+                learns, checks = self.messages.select(learn_arrays), self.messages.select(check_arrays)
                 begin_time = time.time()
                 transducer = Esptia(self.protocol)
                 print(f'BeginTime: {begin_time}')
@@ -46,7 +46,7 @@ class EsptiaTest:
             kfold = KFold(n_splits = min(10, messagel), shuffle = False)
             checktext.write(f'Text: {self.handle_text}\nLevel: {level}\n\n')
             for learn_arrays, check_arrays in kfold.split(range(messagel)):
-                learns, checks = [self.messages[i] for i in learn_arrays], [self.messages[i] for i in check_arrays]
+                learns, checks = self.messages.select(learn_arrays), self.messages.select(check_arrays)
                 start_time = time.time()
                 checktext.write(f'\tStart: {start_time}\n')
                 transducer = Esptia(self.protocol)
@@ -72,7 +72,7 @@ class EsptiaTest:
             for learn_arrays, check_arrays in kfold.split(range(messagel)):
                 checktext.write(f'==========Poll: {poll}==========\n\n')
                 # :type: list[list[Message]]。
-                learns, checks = [self.messages[i] for i in learn_arrays], [self.messages[i] for i in check_arrays]
+                learns, checks = self.messages.select(learn_arrays), self.messages.select(check_arrays)
                 begin_time = time.time()
                 transducer = Esptia(self.protocol)
                 transducer.build_esptia(learns, level, limit)
@@ -129,8 +129,8 @@ class EsptiaTest:
         with open(f'{self.check_holder}guessreq/{check_text}-{poll}-guess.txt', 'w') as checktext:
             with open(f'{self.check_holder}guessreq/{check_text}-{poll}.txt', 'w') as srctext:
                 for learn_arrays, check_arrays in kfold.split(range(messagel)):
-                    learns = [self.messages[i] for i in learn_arrays]
-                    checks = [self.messages[i] for i in check_arrays]
+                    learns = self.messages.select(learn_arrays)
+                    checks = self.messages.select(check_arrays)
                     transducer = Esptia(self.protocol)
                     transducer.build_esptia(learns, level, limit)
                     transducer.finish_pretree()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from daikon.textpro import Message, fold_message_seqs
+from daikon.corpus import Corpus, cache_corpus
+from automata.common import Transducer
+
+
+class CorpusTest(TestCase):
+    def setUp(self):
+        self.data = [
+            [Message.build_mespair('USER', ['anonymous'], '331', ['Guest login ok']),
+             Message.build_mespair('PASS', ['guest'], '230', [])],
+            [Message.build_mespair('USER', ['ftp'], '331', ['Guest login ok']),
+             Message.build_mespair('QUIT', [], '221', ['Goodbye'])],
+            [Message.build_mespair(chr(955), [], '220', ['ready'])]
+        ]
+
+    def test_build_corpus(self):
+        corpus = Corpus.build_corpus(self.data)
+        self.assertEqual(len(corpus), 3)
+        self.assertEqual(corpus.offsets.tolist(), [0, 2, 4, 5])
+        self.assertEqual(corpus.gives.tolist(), [0, 1, 0, 2, 3])
+        self.assertEqual([str(arrayi) for arrayi in corpus], [str(arrayi) for arrayi in self.data])
+
+    def test_save_corpus(self):
+        corpus_cata = tempfile.mkdtemp()
+        Corpus.build_corpus(self.data).save_corpus(corpus_cata)
+        corpus = Corpus.load_corpus(corpus_cata, 'r')
+        self.assertEqual([str(arrayi) for arrayi in corpus], [str(arrayi) for arrayi in self.data])
+        shutil.rmtree(corpus_cata)
+
+    def test_build_pretree(self):
+        transducer = Transducer('ftp')
+        transducer.build_pretree(Corpus.build_corpus(self.data))
+        self.assertEqual(len(transducer.states), 5)
+        self.assertEqual(transducer.q0.poll, 3)
+        user = [trani for trani in transducer.q0.after if trani.give == 'USER'][0]
+        self.assertEqual(user.poll, 2)
+        self.assertIs(transducer.q0.seek_after('USER', '331'), user)
+        self.assertEqual(transducer.q0.give_index['USER'], {user})
+        self.assertEqual(user.minors, [(('anonymous',), ('Guest login ok',)), (('ftp',), ('Guest login ok',))])
+
+    def test_fold_corpus(self):
+        data = [[Message.build_mespair('DATA', [], '354', ['go'])] +
+                [Message.build_mespair('content', [f'line{i}'], chr(955), []) for i in range(i + 2)]
+                for i in range(3)]
+        folds = list(fold_message_seqs(data))
+        corpus = Corpus.build_corpus(folds)
+        self.assertEqual(corpus.folds.tolist(), [0, 1, 0, 2, 0, 3])
+        self.assertEqual(corpus.look_minors(3), (('line0',), ()))
+        self.assertEqual([[arrayj.look_folds() for arrayj in arrayi] for arrayi in corpus],
+                         [[arrayj.look_folds() for arrayj in arrayi] for arrayi in folds])
+        # 折叠之后，各转移的次要字段仍然与不折叠时相同：第一行属于进入转移，其余的属于自环。
+        results = []
+        for arrays, unique in ((data, False), (folds, False), (folds, True), (corpus, False)):
+            transducer = Transducer('smtp')
+            transducer.build_pretree(arrays, unique)
+            results.append(sorted((trani.give, trani.poll, list(trani.minors)) for trani in transducer.transitions))
+        self.assertEqual(results[1], results[2])
+        self.assertEqual(results[1], results[3])
+        self.assertEqual(sorted(minori for give, poll, minors in results[0] for minori in minors),
+                         sorted(minori for give, poll, minors in results[1] for minori in minors))
+
+    def test_cache_corpus(self):
+        corpus_cata = tempfile.mkdtemp()
+        handle_text = os.path.join(corpus_cata, 'handle.txt')
+        with open(handle_text, 'w') as text:
+            text.write('USER:anonymous\n331:Guest login ok\n##########\nQUIT:\n221:Goodbye\n##########\n')
+        cache_cata = os.path.join(corpus_cata, 'cache')
+        first = [str(arrayi) for arrayi in cache_corpus(handle_text, cache_cata)]
+        self.assertEqual(len(os.listdir(cache_cata)), 1)
+        self.assertEqual([str(arrayi) for arrayi in cache_corpus(handle_text, cache_cata)], first)
+        # 内容改变之后缓存失效，超过大小上限的旧缓存被淘汰。
+        with open(handle_text, 'a') as text:
+            text.write('NOOP:\n200:OK\n##########\n')
+        self.assertEqual(len(list(cache_corpus(handle_text, cache_cata, 0))), 3)
+        self.assertEqual(os.listdir(cache_cata), [])
+        shutil.rmtree(corpus_cata)
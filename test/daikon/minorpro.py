@@ -0,0 +1,117 @@
+import io
+import os
+import tracemalloc
+import weakref
+from unittest import TestCase
+from daikon import minorpro
+from daikon.textpro import Message
+from daikon.minorpro import MinorTable, Minors, SpillMinors
+from automata.common import Transducer
+
+
+class MinorsTest(TestCase):
+    def setUp(self):
+        self.rows = [
+            (('anonymous',), ('Guest login ok',)),
+            (('ftp',), ('Guest, login ok',)),
+            (('guest',), ('Guest "login" ok',))
+        ]
+
+    def test_minors(self):
+        minors = Minors(self.rows[:1])
+        minors.extend(Minors(self.rows[1:]))
+        self.assertEqual(minors, self.rows)
+        self.assertEqual((len(minors), minors[0], minors[-1]), (3, self.rows[0], self.rows[2]))
+        del minors[1:]
+        self.assertEqual(list(minors), self.rows[:1])
+
+    def test_share_minors(self):
+        share, minorpro.minor_share = minorpro.minor_share, 2
+        table = MinorTable()
+        red, blue = Minors(self.rows[:1], table), Minors(self.rows[1:], table)
+        red.extend(blue)
+        # 共享的MinorBlock不再修改，之后添加的行放入新的MinorBlock。
+        self.assertIs(red.blocks[-1], blue.blocks[0])
+        red.append(self.rows[0])
+        blue.append(self.rows[1])
+        self.assertEqual(red, self.rows + self.rows[:1])
+        self.assertEqual(blue, self.rows[1:] + self.rows[1:2])
+        minorpro.minor_share = share
+
+    def test_minor_table(self):
+        table = MinorTable()
+        minors = Minors(self.rows[:1], table)
+        # 同一个编号表的Minors共享字段编号，不同编号表的Minors合并时复制字段。
+        self.assertIs(Minors(self.rows[1:], table).table, table)
+        fresh = Minors(self.rows[1:])
+        self.assertIsNot(fresh.table, table)
+        minors.extend(fresh)
+        self.assertEqual(minors, self.rows)
+        self.assertEqual(len(table), 6)
+        # 截断之后保留的行放入新的编号表，不再被引用的编号表随之释放。
+        old, current = weakref.ref(table), MinorTable()
+        del table
+        minors.truncate(1, current)
+        self.assertIs(minors.table, current)
+        self.assertEqual(list(minors), self.rows[:1])
+        self.assertIsNone(old())
+        self.assertEqual(len(current), 2)
+
+    def test_transducer_tables(self):
+        # 每个状态机使用自己的编号表，新建其他状态机不影响已有状态机之后加入的次要字段。
+        mespairs = [Message.build_mespair('USER', [user], '331', ['Guest login ok']) for user in ('anonymous', 'ftp')]
+        first = Transducer('ftp')
+        first.build_pretree([[mespairs[0]]])
+        second = Transducer('ftp')
+        second.build_pretree([[Message.build_mespair('USER', ['guest'], '331', ['Password'])]])
+        first.build_pretree([[mespairs[1]]])
+        self.assertIsNot(first.table, second.table)
+        trani = first.q0.seek_after('USER', '331')
+        self.assertIs(trani.minors.table, first.table)
+        self.assertEqual(list(trani.minors), [mespairi.look_minors() for mespairi in mespairs])
+        self.assertEqual((len(first.table), len(second.table)), (3, 2))
+
+    def test_write_csv(self):
+        csvtext = io.StringIO()
+        self.assertTrue(Minors(self.rows).write_csv(csvtext))
+        self.assertEqual(csvtext.getvalue(),
+                         'a0,b0\nanonymous,Guest login ok\nftp,Guest  login ok\nguest,Guest \'login\' ok\n')
+        # 次要字段长度不同时不做判断。
+        self.assertFalse(Minors(self.rows + [((), ())]).write_csv(io.StringIO()))
+
+    def test_spill_minors(self):
+        red, blue = SpillMinors(self.rows[:2], 2), SpillMinors(self.rows[2:], 2)
+        self.assertEqual((len(red.segments), len(red.blocks)), (1, 0))
+        # 合并时接上blue的段文件，之后添加的行写入新的段文件。
+        red.extend(blue)
+        red.append(self.rows[0])
+        red.append(self.rows[1])
+        self.assertEqual(red, self.rows + self.rows[:2])
+        self.assertEqual(len(red.segments), 3)
+        csvtext = io.StringIO()
+        self.assertTrue(red.write_csv(csvtext))
+        expected = io.StringIO()
+        Minors(self.rows + self.rows[:2]).write_csv(expected)
+        self.assertEqual(csvtext.getvalue(), expected.getvalue())
+        roads = [road for road, size in red.segments]
+        del red[1:]
+        self.assertEqual((list(red), red[0]), (self.rows[:1], self.rows[0]))
+        self.assertFalse(any(os.path.exists(road) for road in roads))
+
+    def test_spill_memory(self):
+        red = SpillMinors(limit = 64)
+        tracemalloc.start()
+        for i in range(20000):
+            red.append(((f'user{i}' * 4,), (f'Guest login ok {i}' * 4,)))
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # 溢出的行不进入编号表，内存只与缓冲的行数有关；全部留在内存中需要数MiB。
+        self.assertIsNone(red.table)
+        self.assertLess(size, 256 << 10)
+        self.assertEqual((len(red), red[19999]), (20000, (('user19999' * 4,), ('Guest login ok 19999' * 4,))))
+        transducer = Transducer('ftp', True)
+        for i in range(2000):
+            transducer.build_pretree([[Message.build_mespair('USER', [f'user{i}'], '331', [f'Guest login ok {i}'])]])
+        # 只有新建转移时的第一行经过编号表。
+        self.assertEqual(len(transducer.table), 2)
+        self.assertEqual(len(transducer.q0.seek_after('USER', '331').minors), 2000)
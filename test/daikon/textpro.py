@@ -1,5 +1,10 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase
-from daikon.textpro import Message, build_message_seqs
+from file_manager import open_handle
+from daikon.textpro import Message, MessageSeqs, build_message_seqs, parse_message_seqs, pool_message_seqs, \
+    fold_message_seqs
 
 
 class MessageTest(TestCase):
@@ -23,6 +28,61 @@ class MessageTest(TestCase):
         self.assertFalse(self.data[3] in [self.data[1], self.data[2]])
         self.assertFalse(self.data[4] in [self.data[1], self.data[2]])
 
+    def test_parse_message_seqs(self):
+        lines = ['USER:anonymous\n', '331:Guest login ok\n', '##########\n', '##########\n', 'QUIT:\n',
+                 '$LOSS$LOGO\n', 'PASS:x###y\n', '##########\n', '221']
+        arrays = list(parse_message_seqs(lines))
+        self.assertEqual([[arrayj.look_major() for arrayj in arrayi] for arrayi in arrays],
+                         [[('USER', '331')], [('QUIT', chr(955)), ('PASS', '##########')]])
+        self.assertEqual(arrays[1][0].look_minors(), (('LOSS_MINOR',), ('LOSS_MINOR',)))
+        self.assertEqual(arrays[1][1].look_minors(), (('x', 'y'), ('LOSS_MINOR',)))
+
+    def test_message_seqs(self):
+        handle_fd, handle_text = tempfile.mkstemp(suffix = '.txt')
+        with os.fdopen(handle_fd, 'w') as text:
+            for i in range(5):
+                text.write(f'USER:u{i}\n331:ok\n##########\n')
+        arrays = MessageSeqs(handle_text)
+        self.assertEqual(len(arrays), 5)
+        self.assertEqual([arrayi[0].give_minors for arrayi in arrays.select([3, 1])], [('u1',), ('u3',)])
+        self.assertEqual([arrayi[0].give_minors for arrayi in arrays[1:4].select([0, 2])], [('u1',), ('u3',)])
+        self.assertEqual([str(arrayi) for arrayi in arrays], [str(arrayi) for arrayi in build_message_seqs(handle_text)])
+        os.remove(handle_text)
+
+    def test_pool_message_seqs(self):
+        handle_fd, handle_text = tempfile.mkstemp(suffix = '.txt')
+        with os.fdopen(handle_fd, 'w') as text:
+            for i in range(40):
+                # 第20个流是奇数行，报文对跨越流分隔符，需要回退为顺序解析。
+                text.write(f'USER:u{i}\n331:ok\n' + ('QUIT:\n' if i == 20 else '') + '##########\n')
+        self.assertEqual([str(arrayi) for arrayi in pool_message_seqs(handle_text, 2, 0)],
+                         [str(arrayi) for arrayi in build_message_seqs(handle_text)])
+        os.remove(handle_text)
+
+    def test_fold_message_seqs(self):
+        arrays = [[Message.build_mespair('DATA', [], '354', ['go'])] +
+                  [Message.build_mespair('content', [f'line{i}'], chr(955), ['LOSS_MINOR']) for i in range(4)] +
+                  [Message.build_mespair('QUIT', [], '221', ['bye']), Message.build_mespair('QUIT', [], '221', ['bye'])]]
+        folded = list(fold_message_seqs(arrays))[0]
+        # 只折叠文本内容报文对，各个报文对的次要字段按顺序保留。
+        self.assertEqual([(arrayi.give_major, arrayi.poll) for arrayi in folded],
+                         [('DATA', 1), ('content', 4), ('QUIT', 1), ('QUIT', 1)])
+        self.assertEqual(folded[1].give_minors, ('line0',))
+        self.assertEqual(folded[1].look_folds(), [((f'line{i}',), ('LOSS_MINOR',)) for i in range(4)])
+        self.assertEqual(arrays[0][1].folds, ())
+
+    def test_compressed_message_seqs(self):
+        handle_cata = tempfile.mkdtemp()
+        for suffix in ('.txt', '.txt.gz', '.txt.xz'):
+            with open_handle(os.path.join(handle_cata, f'handle{suffix}'), 'w') as text:
+                text.write('USER:anonymous\n331:Guest login ok\n##########\nQUIT:\n221:Goodbye\n##########\n')
+        arrays = [[str(arrayi) for arrayi in build_message_seqs(os.path.join(handle_cata, f'handle{suffix}'))]
+                  for suffix in ('.txt', '.txt.gz', '.txt.xz')]
+        self.assertEqual(len(arrays[0]), 2)
+        self.assertEqual(arrays[0], arrays[1])
+        self.assertEqual(arrays[0], arrays[2])
+        shutil.rmtree(handle_cata)
+
 
 def test_build_message_seqs():
     pass
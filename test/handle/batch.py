@@ -0,0 +1,22 @@
+import os
+from unittest import TestCase
+from handle_batch import plan_names
+
+
+class NameTest(TestCase):
+    def test_unique_names(self):
+        datatexts = ['/data/a/x.pcap', '/data/b/x.pcap', '/data/c/x.pcapng', '/data/a/y.pcap']
+        names = plan_names(datatexts)
+        # 不同目录下的同名文件得到不同的处理文件名称，不重名的文件保持原名。
+        self.assertEqual(len(set(names)), len(datatexts))
+        self.assertEqual(names[3], 'y')
+        for namei in names[:3]:
+            self.assertTrue(namei.startswith('x-'))
+        # 名称只由完整路径决定，与列表的顺序无关。
+        self.assertEqual(plan_names(datatexts[::-1]), names[::-1])
+
+    def test_relative_names(self):
+        # 相对路径按照完整路径区分。
+        names = plan_names(['a/x.pcap', 'b/x.pcap'])
+        self.assertNotEqual(names[0], names[1])
+        self.assertEqual(plan_names([os.path.abspath('a/x.pcap'), 'b/x.pcap']), names)
@@ -0,0 +1,165 @@
+import os
+import random
+import resource
+import time
+import multiprocessing
+from scapy.layers.inet import IP, TCP
+from scapy.layers.l2 import Ether
+from scapy.utils import PcapWriter
+from os_manager import check_cata
+from daikon.textpro import build_message_seqs
+from automata.common import Transducer
+
+# 各协议的服务器端口以及请求、响应报文模板。
+bench_protocols = {
+    'ftp': (21, [('USER anonymous', '331 Guest login ok'), ('PASS guest', '230 Guest login ok'),
+                 ('CWD /pub', '250 CWD command successful'), ('TYPE I', '200 Type set to I'),
+                 ('RETR {}', '226 Transfer complete'), ('QUIT', '221 Goodbye')]),
+    'smtp': (25, [('EHLO client.example', '250 mail.example'), ('MAIL FROM:<a@example>', '250 Mail OK'),
+                  ('RCPT TO:<b@example>', '250 Mail OK'), ('DATA {}', '354 End data with <CR><LF>.<CR><LF>'),
+                  ('QUIT', '221 Bye')]),
+    'pop': (110, [('USER alice', '+OK'), ('PASS secret', '+OK 2 messages'), ('STAT', '+OK 2 320'),
+                  ('RETR 1 {}', '+OK 160 octets'), ('QUIT', '+OK Bye')]),
+    'lightftp': (9999, [('USER anonymous', '331 User anonymous OK. Password required'),
+                        ('PASS guest', '230 User logged in, proceed.'), ('PWD', '257 "/" is a current directory.'),
+                        ('STOR {}', '226 Transfer complete. Closing data connection.'), ('QUIT', '221 Goodbye!')]),
+    'live555': (8554, [('OPTIONS rtsp://server/a RTSP/1.0\r\nCSeq: 1', 'RTSP/1.0 200 OK\r\nCSeq: 1'),
+                       ('DESCRIBE rtsp://server/a RTSP/1.0\r\nCSeq: 2', 'RTSP/1.0 200 OK\r\nCSeq: 2\r\n{}'),
+                       ('SETUP rtsp://server/a/track1 RTSP/1.0\r\nCSeq: 3', 'RTSP/1.0 200 OK\r\nCSeq: 3'),
+                       ('PLAY rtsp://server/a RTSP/1.0\r\nCSeq: 4', 'RTSP/1.0 200 OK\r\nCSeq: 4'),
+                       ('TEARDOWN rtsp://server/a RTSP/1.0\r\nCSeq: 5', 'RTSP/1.0 200 OK\r\nCSeq: 5')])
+}
+
+
+class BenchConversation:
+    '''
+    一个合成的TCP会话，按步产出报文。
+    '''
+
+    def __init__(self, number, protocol, messages, payload, rand):
+        port, self.templates = bench_protocols[protocol]
+        self.client = ('10.%d.%d.2' % (number >> 8 & 0xff, number & 0xff), 1024 + number % 60000)
+        self.server = ('10.255.0.1', port)
+        self.messages, self.payload, self.rand = messages, payload, rand
+        self.cseq, self.sseq = rand.randrange(1 << 32), rand.randrange(1 << 32)
+
+    def packet(self, give, flags, data = b''):
+        src, dst = (self.client, self.server) if give else (self.server, self.client)
+        seq, ack = (self.cseq, self.sseq) if give else (self.sseq, self.cseq)
+        pkt = Ether() / IP(src = src[0], dst = dst[0]) / TCP(sport = src[1], dport = dst[1], flags = flags,
+                                                             seq = seq, ack = ack) / data
+        step = len(data) + (1 if 'S' in flags or 'F' in flags else 0)
+        if give:
+            self.cseq = (self.cseq + step) % (1 << 32)
+        else:
+            self.sseq = (self.sseq + step) % (1 << 32)
+        return pkt
+
+    def steps(self):
+        yield [self.packet(True, 'S'), self.packet(False, 'SA'), self.packet(True, 'A')]
+        for i in range(self.messages):
+            give, reap = self.templates[i % len(self.templates)]
+            filler = ''.join(self.rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(self.payload))
+            end = '\r\n\r\n' if self.server[1] == 8554 else '\r\n'
+            yield [self.packet(True, 'PA', (give.format(filler) + end).encode())]
+            yield [self.packet(False, 'PA', (reap.format(filler) + end).encode())]
+        yield [self.packet(True, 'FA'), self.packet(False, 'FA'), self.packet(True, 'A')]
+
+
+def build_bench_pcap(pcap_text, protocol, streams = 100, messages = 10, interleave = 8, payload = 16, seed = 0):
+    '''
+    生成确定的合成pcap文件。
+    :param streams: TCP流数量。
+    :param messages: 每个TCP流的请求、响应报文对数量。
+    :param interleave: 同时交织的TCP流数量，为1时TCP流依次出现。
+    :param payload: 每个报文附加的随机字符数量。
+    :return: 报文数量。
+    '''
+    rand = random.Random(seed)
+    actives, fresh, count, timestamp = [], 0, 0, 1_600_000_000.0
+    with PcapWriter(pcap_text, sync = False) as writer:
+        while actives or fresh < streams:
+            while len(actives) < interleave and fresh < streams:
+                actives.append(BenchConversation(fresh, protocol, messages, payload, rand).steps())
+                fresh += 1
+            active = rand.randrange(len(actives))
+            pkts = next(actives[active], None)
+            if pkts is None:
+                actives.pop(active)
+                continue
+            for pkti in pkts:
+                timestamp += 0.001
+                pkti.time = timestamp
+                writer.write(pkti)
+                count += 1
+    return count
+
+
+def bench_backend(backend, pcap_text, sake_text, protocol):
+    '''
+    调用一种处理方式，分析数据报文并写入文件。
+    '''
+    if backend == 'native':
+        from handle_native import handle_native
+        handle_native(pcap_text, sake_text, protocol)
+    elif backend in ('scapy', 'scapy-mapped'):
+        from handle_scapy import handle_flows
+        handle_flows(pcap_text, sake_text, 'tcp', mapped = backend == 'scapy-mapped')
+    elif backend in ('pyshark', 'pyshark-single', 'fields'):
+        from handle_pyshark import handle_pcap
+        handle_pcap(pcap_text, sake_text, protocol, 'w', backend == 'pyshark-single',
+                    'fields' if backend == 'fields' else 'pyshark')
+    elif backend == 'pyshark-tcp':
+        from handle_pyshark import handle_pcap
+        handle_pcap(pcap_text, sake_text, 'tcp', 'w', True)
+    else:
+        raise ValueError(f'Backend {backend} not supported.')
+
+
+def bench_worker(backend, pcap_text, sake_text, protocol, results):
+    # 每种处理方式在独立的spawn进程中运行，峰值内存互不影响；fork的子进程会继承父进程的峰值内存。
+    # 记录的内存是峰值减去进程开始时（导入模块之后）的峰值，即该处理方式增加的内存。
+    entry = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        stages = {}
+        begin = time.perf_counter()
+        bench_backend(backend, pcap_text, sake_text, protocol)
+        stages['handle'] = time.perf_counter() - begin
+        begin = time.perf_counter()
+        arrays = build_message_seqs(sake_text)
+        stages['parse'] = time.perf_counter() - begin
+        begin = time.perf_counter()
+        Transducer(protocol).build_pretree(arrays)
+        stages['pretree'] = time.perf_counter() - begin
+        results.put((stages, len(arrays), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - entry, None))
+    except BaseException as error:
+        results.put((None, 0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - entry,
+                     f'{type(error).__name__}: {str(error)[:60]}'))
+
+
+def bench_main(protocol = 'ftp', backends = ('native', 'scapy-mapped', 'scapy', 'pyshark-single', 'fields'),
+               streams = 100, messages = 10, interleave = 8, payload = 16, seed = 0):
+    check_holder = f'{check_cata}handle/bench/'
+    os.makedirs(check_holder, exist_ok = True)
+    pcap_text = f'{check_holder}bench-{protocol}-{streams}-{messages}-{interleave}-{payload}-{seed}.pcap'
+    begin = time.perf_counter()
+    count = build_bench_pcap(pcap_text, protocol, streams, messages, interleave, payload, seed)
+    print(f'Generate: {count} packets, {os.path.getsize(pcap_text)} bytes, {time.perf_counter() - begin:.3f}s')
+    print(f'{"Backend":<16}{"pkt/s":>12}{"PeakRSS+(MiB)":>14}{"Sessions":>10}{"handle":>10}{"parse":>10}{"pretree":>10}')
+    spawn = multiprocessing.get_context('spawn')
+    for backend in backends:
+        results = spawn.Queue()
+        worker = spawn.Process(target = bench_worker,
+                               args = (backend, pcap_text, f'{check_holder}bench-{backend}.txt', protocol, results))
+        worker.start()
+        stages, sessions, maxrss, error = results.get()
+        worker.join()
+        if error:
+            print(f'{backend:<16}{"failed":>12}{maxrss / 1024:>14.1f}  {error}')
+            continue
+        print(f'{backend:<16}{count / stages["handle"]:>12.0f}{maxrss / 1024:>14.1f}{sessions:>10}'
+              f'{stages["handle"]:>10.3f}{stages["parse"]:>10.3f}{stages["pretree"]:>10.3f}')
+
+
+if __name__ == '__main__':
+    bench_main('ftp')
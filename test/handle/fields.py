@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+from os_manager import tshark_road
+from test.handle.bench import build_bench_pcap
+
+
+@skipUnless(shutil.which(tshark_road), 'tshark is not installed.')
+class FieldsTest(TestCase):
+    def setUp(self):
+        self.holder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.holder, ignore_errors = True)
+
+    def test_handle_fields(self):
+        from handle_pyshark import handle_fields, handle_pcap
+        for protocol in ('ftp', 'smtp', 'pop'):
+            pcap_text = os.path.join(self.holder, f'{protocol}.pcap')
+            build_bench_pcap(pcap_text, protocol, streams = 6, messages = 6, interleave = 3)
+            # 字段模式与pyshark的结果逐字节相同。
+            handle_pcap(pcap_text, os.path.join(self.holder, f'{protocol}-pyshark.txt'), protocol, 'w', True)
+            handle_fields(pcap_text, os.path.join(self.holder, f'{protocol}-fields.txt'), protocol)
+            with open(os.path.join(self.holder, f'{protocol}-pyshark.txt'), 'rb') as pyshark_text, \
+                    open(os.path.join(self.holder, f'{protocol}-fields.txt'), 'rb') as fields_text:
+                self.assertEqual(fields_text.read(), pyshark_text.read(), protocol)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from handle_index import extract_streams, index_road, indexes, load_index, map_streams
+from handle_native import map_records, read_flows
+from test.handle.bench import build_bench_pcap
+from test.handle.native import look_flows
+
+
+class IndexTest(TestCase):
+    def setUp(self):
+        self.holder = tempfile.mkdtemp()
+        self.source_text = os.path.join(self.holder, 'source.pcap')
+        build_bench_pcap(self.source_text, 'ftp', streams = 12, messages = 4, interleave = 4)
+        indexes.clear()
+
+    def tearDown(self):
+        indexes.clear()
+        shutil.rmtree(self.holder, ignore_errors = True)
+
+    def test_streams(self):
+        index = load_index(self.source_text)
+        self.assertEqual(len(index), 12)
+        self.assertTrue(os.path.exists(index_road(self.source_text)))
+        flows = look_flows(read_flows(self.source_text, 'ftp'))
+        # 只读取第1、5、9个TCP流，得到的连接与完整读取时相同。
+        numbers = [1, 5, 9]
+        chosen = [flowi[1:] for flowi in flows if flowi[0] in numbers]
+        records = ((linktype, timestamp, packet) for linktype, timestamp, span, packet in map_streams(self.source_text, numbers))
+        self.assertEqual([flowi[1:] for flowi in look_flows(read_flows(self.source_text, 'ftp', records))], chosen)
+        sub_text = extract_streams(self.source_text, numbers, os.path.join(self.holder, 'sub.pcap'))
+        self.assertEqual([flowi[1:] for flowi in look_flows(read_flows(sub_text, 'ftp'))], chosen)
+        key = index.look_key(numbers[0])
+        self.assertIn(21, key[1::2])
+
+    def test_cache(self):
+        index = load_index(self.source_text)
+        # 同一进程内不重复读取索引文件。
+        self.assertIs(load_index(self.source_text), index)
+        # 其他进程读取索引文件，得到相同的内容。
+        indexes.clear()
+        reread = load_index(self.source_text)
+        self.assertIsNot(reread, index)
+        self.assertEqual(reread.look_spans(range(len(reread))), index.look_spans(range(len(index))))
+        # pcap文件改变之后重新建立索引。
+        with open(self.source_text, 'rb') as source:
+            data = source.read()
+        with open(self.source_text, 'ab') as source:
+            source.write(data[24:])
+        rebuilt = load_index(self.source_text)
+        self.assertIsNot(rebuilt, reread)
+        self.assertEqual(len(rebuilt.look_spans(range(len(rebuilt)))), len(list(map_records(self.source_text))))
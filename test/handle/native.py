@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from handle_native import follow_records, read_flows, read_records
+from test.handle.bench import build_bench_pcap
+
+
+class AppendWriter:
+    '''
+    代替FollowFile的等待函数：每次等待时将完整pcap文件的下一段追加到目标文件中，模拟仍在写入的抓包文件而不依赖时钟。
+    '''
+
+    def __init__(self, source_text, target_text, pieces):
+        with open(source_text, 'rb') as source:
+            data = source.read()
+        size = -(-len(data) // pieces)
+        self.pieces = [data[begin:begin + size] for begin in range(0, len(data), size)]
+        self.target_text = target_text
+        self.waits = 0
+
+    def __call__(self, interval):
+        self.waits += 1
+        if self.pieces:
+            with open(self.target_text, 'ab') as target:
+                target.write(self.pieces.pop(0))
+
+    def finished(self):
+        return not self.pieces
+
+
+def look_flows(flows):
+    return [(flowi.number, flowi.key, flowi.messpairs, flowi.lines) for flowi in flows if flowi.flag]
+
+
+class FollowTest(TestCase):
+    def setUp(self):
+        self.holder = tempfile.mkdtemp()
+        self.source_text = os.path.join(self.holder, 'source.pcap')
+        self.target_text = os.path.join(self.holder, 'target.pcap')
+        build_bench_pcap(self.source_text, 'ftp', streams = 12, messages = 4, interleave = 4)
+        open(self.target_text, 'wb').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.holder, ignore_errors = True)
+
+    def test_follow_records(self):
+        writer = AppendWriter(self.source_text, self.target_text, 8)
+        records = follow_records(self.target_text, 0.05, None, writer.finished, writer)
+        flows = look_flows(read_flows(self.target_text, 'ftp', records))
+        # 每段写入之前都等待一次，写入结束之后读到文件末尾即停止，不再等待。
+        self.assertEqual(writer.waits, 8)
+        self.assertEqual(os.path.getsize(self.target_text), os.path.getsize(self.source_text))
+        self.assertEqual(flows, look_flows(read_flows(self.target_text, 'ftp')))
+        self.assertEqual(len(flows), 12)
+
+    def test_follow_idle(self):
+        # 只写入一半的文件：连续idle秒不增长之后停止读取，产出已经完整的报文记录。
+        with open(self.source_text, 'rb') as source, open(self.target_text, 'wb') as target:
+            target.write(source.read(os.path.getsize(self.source_text) // 2))
+        waits = []
+        records = list(follow_records(self.target_text, 0.25, 1.0, None, waits.append))
+        self.assertEqual(waits, [0.25] * 4)
+        self.assertTrue(records)
+        self.assertEqual(records, list(read_records(self.source_text))[:len(records)])
+
+    def test_unsupported_protocol(self):
+        # RTSP需要与handle_pyshark.step_live555相同的起始行解析，暂不支持。
+        with self.assertRaises(ValueError):
+            next(read_flows(self.source_text, 'live555'))
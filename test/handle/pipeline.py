@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from daikon.textpro import build_message_seqs
+from handle_native import handle_native
+from handle_pipeline import follow_message_seqs, pipe_message_seqs
+from test.handle.bench import build_bench_pcap
+
+
+def look_arrays(arrays):
+    return [[(arrayj.look_major(), arrayj.look_minors()) for arrayj in arrayi] for arrayi in arrays]
+
+
+class PipelineTest(TestCase):
+    def setUp(self):
+        self.holder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.holder, ignore_errors = True)
+
+    def test_pipe_message_seqs(self):
+        # 直接由TCP流构建的报文序列与读取处理文件的结果相同，同时写入的处理文件与handle_native相同。
+        for protocol in ('ftp', 'smtp', 'pop'):
+            datatext = os.path.join(self.holder, f'{protocol}.pcap')
+            build_bench_pcap(datatext, protocol, streams = 12, messages = 5, interleave = 4)
+            handle_text = os.path.join(self.holder, f'{protocol}.txt')
+            pipe_text = os.path.join(self.holder, f'{protocol}-pipe.txt')
+            handle_native(datatext, handle_text, protocol)
+            arrays = list(pipe_message_seqs(datatext, protocol, pipe_text))
+            self.assertEqual(len(arrays), 12)
+            self.assertEqual(look_arrays(arrays), look_arrays(build_message_seqs(handle_text)))
+            with open(handle_text) as handle, open(pipe_text) as pipe:
+                self.assertEqual(pipe.read(), handle.read())
+
+    def test_follow_message_seqs(self):
+        # 跟踪已经写完的文件：连接结束即产出，顺序可能不同，但报文序列与读取处理文件的结果相同。
+        datatext = os.path.join(self.holder, 'ftp.pcap')
+        build_bench_pcap(datatext, 'ftp', streams = 12, messages = 5, interleave = 4)
+        handle_text = os.path.join(self.holder, 'ftp.txt')
+        handle_native(datatext, handle_text, 'ftp')
+        arrays = look_arrays(follow_message_seqs(datatext, 'ftp', finish = lambda: True))
+        self.assertEqual(len(arrays), 12)
+        self.assertEqual(sorted(arrays), sorted(look_arrays(build_message_seqs(handle_text))))